@@ -1,17 +1,42 @@
-from flask import Flask, jsonify, make_response
+import sqlite3
+
+from flask import Flask, jsonify, make_response, request
+from flask.json.provider import DefaultJSONProvider
+from app.config import MAX_CONTENT_LENGTH, PRICE_REFRESH_INTERVAL
+from app.models.stock import PriceRefresher
 from app.routes.auth import auth_bp
 from app.routes.portfolio import portfolio_bp
 from app.routes.stock import stock_bp
 from app.utils.sql_utils import check_database_connection, check_tables_exist
 
+class JSONProvider(DefaultJSONProvider):
+    """JSON provider that also serializes sqlite3.Row results from the models"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, sqlite3.Row):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
 # Create Flask app
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix="/api")
 app.register_blueprint(portfolio_bp, url_prefix="/api")
 app.register_blueprint(stock_bp, url_prefix="/api")
 
+# Keep held symbols' prices warm in this process's cache
+if PRICE_REFRESH_INTERVAL > 0:
+    PriceRefresher(PRICE_REFRESH_INTERVAL).start()
+
+@app.before_request
+def reject_oversized_body():
+    """Refuse request bodies over MAX_CONTENT_LENGTH before any route parses them"""
+    if request.content_length is not None and request.content_length > MAX_CONTENT_LENGTH:
+        return make_response(jsonify({'error': 'Request body too large'}), 413)
+
 # Health check routes
 @app.route('/api/health')
 def healthcheck():
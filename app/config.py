@@ -6,5 +6,10 @@ load_dotenv()
 
 """Env Variables"""
 ALPHA_VANTAGE_API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY')
+ALPHA_VANTAGE_TIMEOUT = float(os.getenv('ALPHA_VANTAGE_TIMEOUT', '5'))
 DB_PATH = os.getenv('DB_PATH', './db/stock_trading.db')
-CREATE_DB = os.getenv('CREATE_DB', 'true').lower() == 'true'
\ No newline at end of file
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '10'))
+CREATE_DB = os.getenv('CREATE_DB', 'true').lower() == 'true'
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(16 * 1024)))
+# Seconds between background refreshes of held symbols' prices; 0 disables it
+PRICE_REFRESH_INTERVAL = float(os.getenv('PRICE_REFRESH_INTERVAL', '0'))
\ No newline at end of file
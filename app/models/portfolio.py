@@ -1,18 +1,78 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
-from typing import List, Dict
+import sqlite3
+import threading
+from typing import List, Dict, Optional
 
 from app.utils.logger import configure_logger
-from app.utils.sql_utils import get_db_connection, execute_query
-from app.models.stock import StockAPI
+from app.utils.sql_utils import get_db_connection, execute_read
+from app.models.stock import FETCH_EXECUTOR, StockAPI, get_stock_api
 
 logger = logging.getLogger(__name__)
 configure_logger(logger)
 
+# SQL is defined once so every call reuses the same text and hits the
+# connection's prepared-statement cache
+# cost_basis depends only on stored columns, so SQLite computes it with the
+# rows; only the values that need live prices are calculated in Python
+_HOLDINGS_SQL = """
+    SELECT symbol, quantity, average_price, quantity * average_price AS cost_basis
+    FROM portfolio
+    WHERE user_id = ? AND quantity > 0
+"""
+
+_BUY_UPSERT_SQL = """
+    INSERT INTO portfolio (user_id, symbol, quantity, average_price)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, symbol) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        average_price = ((average_price * quantity + excluded.average_price * excluded.quantity)
+                         / (quantity + excluded.quantity))
+"""
+
+_HOLDING_QUANTITY_SQL = "SELECT quantity FROM portfolio WHERE user_id = ? AND symbol = ?"
+
+# The share check is part of the UPDATE, so a concurrent sell can't slip in
+# between checking the holding and writing it
+_SELL_UPDATE_SQL = """
+    UPDATE portfolio
+    SET quantity = quantity - ?
+    WHERE user_id = ? AND symbol = ? AND quantity >= ?
+"""
+
+# The trade's timestamp is passed in so the stored row and the returned
+# transaction agree; it is formatted like SQLite's CURRENT_TIMESTAMP (UTC)
+_TXN_INSERT_SQL = """
+    INSERT INTO transactions
+    (user_id, symbol, quantity, price, transaction_type, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_HISTORY_SQL = """
+    SELECT id AS transaction_id, symbol, quantity, price,
+           transaction_type AS type, timestamp, (price * quantity) AS total
+    FROM transactions
+    WHERE user_id = ? AND (? IS NULL OR symbol = ?)
+    ORDER BY timestamp DESC, id DESC
+    LIMIT ? OFFSET ?
+"""
+
+# Page size for transaction history when the caller doesn't ask for one,
+# and the most rows a single page may return
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+
 class PortfolioManager:
-    def __init__(self):
-        """Initialize the PortfolioManager with StockAPI instance"""
-        self.stock_api = StockAPI()
+    def __init__(self, stock_api: Optional[StockAPI] = None):
+        """
+        Initialize the PortfolioManager
+        
+        Args:
+            stock_api: The StockAPI to look prices up with. Defaults to the
+                shared process-wide instance.
+        """
+        self.stock_api = stock_api if stock_api is not None else get_stock_api()
 
     def get_portfolio(self, user_id: int) -> Dict:
         """
@@ -28,37 +88,31 @@ class PortfolioManager:
         """
         try:
             # Get user's holdings from database
-            query = """
-                SELECT symbol, quantity, average_price
-                FROM portfolio
-                WHERE user_id = ? AND quantity > 0
-            """
-            holdings = execute_query(query, (user_id,))
-            
-            portfolio_data = {
-                'holdings': [],
-                'total_value': 0.0
-            }
+            holdings = execute_read(_HOLDINGS_SQL, (user_id,))
             
-            # Get current prices and calculate values
-            for holding in holdings:
-                current_price = self.stock_api.get_stock_price(holding['symbol'])
-                holding_value = holding['quantity'] * current_price['close']
-                holding_info = {
+            # Fetch every holding's price in one batch, then calculate values
+            prices = self.stock_api.get_prices_bulk([holding['symbol'] for holding in holdings])
+
+            # Each holding's value is computed once and reused for its gain and the total
+            holdings_info = [
+                {
                     'symbol': holding['symbol'],
                     'quantity': holding['quantity'],
                     'average_price': holding['average_price'],
-                    'current_price': current_price['close'],
-                    'total_value': holding_value,
-                    'gain_loss': holding_value - (holding['quantity'] * holding['average_price'])
+                    'current_price': (current_price := prices[holding['symbol']]['close']),
+                    'total_value': (holding_value := holding['quantity'] * current_price),
+                    'gain_loss': holding_value - holding['cost_basis']
                 }
-                portfolio_data['holdings'].append(holding_info)
-                portfolio_data['total_value'] += holding_value
+                for holding in holdings
+            ]
             
-            return portfolio_data
+            return {
+                'holdings': holdings_info,
+                'total_value': sum((h['total_value'] for h in holdings_info), 0.0)
+            }
             
         except Exception as e:
-            logger.error(f"Error getting portfolio for user {user_id}: {e}")
+            logger.error("Error getting portfolio for user %s: %s", user_id, e)
             raise
 
     def buy_stock(self, user_id: int, symbol: str, quantity: int) -> Dict:
@@ -84,28 +138,16 @@ class PortfolioManager:
             current_data = self.stock_api.get_stock_price(symbol)
             price = current_data['close']
             total_cost = price * quantity
+            now = datetime.now(timezone.utc)
             
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Start transaction
-                conn.execute("BEGIN TRANSACTION")
+                # sqlite3 opens the transaction implicitly on the first write
                 try:
-                    # Update portfolio
-                    cursor.execute("""
-                        INSERT INTO portfolio (user_id, symbol, quantity, average_price)
-                        VALUES (?, ?, ?, ?)
-                        ON CONFLICT(user_id, symbol) DO UPDATE SET
-                            quantity = quantity + ?,
-                            average_price = ((average_price * quantity + ? * ?) / (quantity + ?))
-                    """, (user_id, symbol, quantity, price, quantity, price, quantity, quantity))
-                    
-                    # Record transaction
-                    cursor.execute("""
-                        INSERT INTO transactions
-                        (user_id, symbol, quantity, price, transaction_type)
-                        VALUES (?, ?, ?, ?, 'BUY')
-                    """, (user_id, symbol, quantity, price))
+                    cursor.execute(_BUY_UPSERT_SQL, (user_id, symbol, quantity, price))
+                    cursor.execute(_TXN_INSERT_SQL, (user_id, symbol, quantity, price, 'BUY',
+                                                     now.strftime(_TIMESTAMP_FORMAT)))
                     
                     transaction_id = cursor.lastrowid
                     conn.commit()
@@ -116,16 +158,16 @@ class PortfolioManager:
                         'quantity': quantity,
                         'price': price,
                         'total_cost': total_cost,
-                        'timestamp': datetime.now()
+                        'timestamp': now
                     }
                     
                 except Exception as e:
                     conn.rollback()
-                    logger.error(f"Error during buy transaction: {e}")
+                    logger.error("Error during buy transaction: %s", e)
                     raise
                     
         except Exception as e:
-            logger.error(f"Error buying stock: {e}")
+            logger.error("Error buying stock: %s", e)
             raise
 
     def sell_stock(self, user_id: int, symbol: str, quantity: int) -> Dict:
@@ -147,37 +189,28 @@ class PortfolioManager:
             raise ValueError("Quantity must be positive")
             
         try:
-            # Check if user has enough shares
-            query = "SELECT quantity FROM portfolio WHERE user_id = ? AND symbol = ?"
-            result = execute_query(query, (user_id, symbol))
-            
-            if not result or result[0]['quantity'] < quantity:
+            # Advisory check so a sale that obviously can't be covered skips the
+            # price lookup; the conditional UPDATE below is what enforces it
+            holding = execute_read(_HOLDING_QUANTITY_SQL, (user_id, symbol))
+            if not holding or holding[0]['quantity'] < quantity:
                 raise ValueError("Insufficient shares for sale")
-                
-            # Get current price
+
+            # Get current price before the write so no lock is held during the API call
             current_data = self.stock_api.get_stock_price(symbol)
             price = current_data['close']
             total_proceeds = price * quantity
-            
+            now = datetime.now(timezone.utc)
+
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Start transaction
-                conn.execute("BEGIN TRANSACTION")
+                # sqlite3 opens the transaction implicitly on the first write
                 try:
-                    # Update portfolio
-                    cursor.execute("""
-                        UPDATE portfolio
-                        SET quantity = quantity - ?
-                        WHERE user_id = ? AND symbol = ?
-                    """, (quantity, user_id, symbol))
-                    
-                    # Record transaction
-                    cursor.execute("""
-                        INSERT INTO transactions
-                        (user_id, symbol, quantity, price, transaction_type)
-                        VALUES (?, ?, ?, ?, 'SELL')
-                    """, (user_id, symbol, quantity, price))
+                    cursor.execute(_SELL_UPDATE_SQL, (quantity, user_id, symbol, quantity))
+                    if cursor.rowcount == 0:
+                        raise ValueError("Insufficient shares for sale")
+                    cursor.execute(_TXN_INSERT_SQL, (user_id, symbol, quantity, price, 'SELL',
+                                                     now.strftime(_TIMESTAMP_FORMAT)))
                     
                     transaction_id = cursor.lastrowid
                     conn.commit()
@@ -188,72 +221,84 @@ class PortfolioManager:
                         'quantity': quantity,
                         'price': price,
                         'total_proceeds': total_proceeds,
-                        'timestamp': datetime.now()
+                        'timestamp': now
                     }
                     
                 except Exception as e:
                     conn.rollback()
-                    logger.error(f"Error during sell transaction: {e}")
+                    logger.error("Error during sell transaction: %s", e)
                     raise
                     
         except Exception as e:
-            logger.error(f"Error selling stock: {e}")
+            logger.error("Error selling stock: %s", e)
             raise
 
-    def get_transaction_history(self, user_id: int) -> List[Dict]:
+    def get_transaction_history(self, user_id: int, limit: int = DEFAULT_HISTORY_LIMIT,
+                                offset: int = 0, symbol: Optional[str] = None) -> List[sqlite3.Row]:
         """
-        Get user's transaction history
+        Get one page of a user's transaction history, newest first
         
         Args:
             user_id: The ID of the user
+            limit: Maximum number of transactions to return
+            offset: Number of newer transactions to skip
+            symbol: Only return transactions for this stock symbol
             
         Returns:
-            list: List of transactions
+            list: sqlite3.Row objects, readable by column name like a dict
         """
         try:
-            query = """
-                SELECT *
-                FROM transactions
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-            """
-            transactions = execute_query(query, (user_id,))
-            
-            return [{
-                'transaction_id': t['id'],
-                'symbol': t['symbol'],
-                'quantity': t['quantity'],
-                'price': t['price'],
-                'type': t['transaction_type'],
-                'timestamp': t['timestamp'],
-                'total': t['price'] * t['quantity']
-            } for t in transactions]
+            with get_db_connection() as conn:
+                # Columns are aliased in SQL, so the rows are returned as-is
+                return list(conn.execute(_HISTORY_SQL, (user_id, symbol, symbol, limit, offset)))
             
         except Exception as e:
-            logger.error(f"Error getting transaction history: {e}")
+            logger.error("Error getting transaction history: %s", e)
             raise
 
-    def get_stock_info(self, symbol: str) -> Dict:
+    def get_stock_info(self, symbol: str, include_company: bool = True,
+                       include_historical: bool = False) -> Dict:
         """
         Get comprehensive stock information
         
         Args:
             symbol: The stock symbol to look up
+            include_company: Whether to include company info
+            include_historical: Whether to include historical data
             
         Returns:
-            dict: Combined current price, company info, and historical data
+            dict: Current price, plus company info and historical data
+                when requested
         """
         try:
-            current_price = self.stock_api.get_stock_price(symbol)
-            company_info = self.stock_api.get_company_info(symbol)
-            historical_data = self.stock_api.get_historical_data(symbol)
-            
-            return {
-                'current_price': current_price,
-                'company_info': company_info,
-                'historical_data': historical_data
-            }
+            lookups = {'current_price': self.stock_api.get_stock_price}
+            if include_company:
+                lookups['company_info'] = self.stock_api.get_company_info
+            if include_historical:
+                lookups['historical_data'] = self.stock_api.get_historical_data
+
+            # The lookups are independent, so run them side by side
+            futures = {key: FETCH_EXECUTOR.submit(lookup, symbol) for key, lookup in lookups.items()}
+            return {key: future.result() for key, future in futures.items()}
             
         except Exception as e:
-            logger.error(f"Error getting stock info: {e}")
-            raise
\ No newline at end of file
+            logger.error("Error getting stock info: %s", e)
+            raise
+
+
+_portfolio_manager = None
+_portfolio_manager_lock = threading.Lock()
+
+def get_portfolio_manager() -> PortfolioManager:
+    """
+    Get the process-wide PortfolioManager instance, creating it on first use
+    
+    Returns:
+        PortfolioManager: The shared PortfolioManager instance
+    """
+    global _portfolio_manager
+    if _portfolio_manager is None:
+        with _portfolio_manager_lock:
+            if _portfolio_manager is None:
+                _portfolio_manager = PortfolioManager()
+    return _portfolio_manager
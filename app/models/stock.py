@@ -1,12 +1,322 @@
+import orjson
 import requests
 import logging
-from datetime import datetime, timedelta
-from app.config import ALPHA_VANTAGE_API_KEY
+import threading
+import time
+from operator import itemgetter
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.config import ALPHA_VANTAGE_API_KEY, ALPHA_VANTAGE_TIMEOUT
 from app.utils.logger import configure_logger
+from app.utils.sql_utils import execute_read
 
 logger = logging.getLogger(__name__)
 configure_logger(logger)
 
+# Shared HTTP session so keep-alive connections to Alpha Vantage are reused.
+# A timed-out read is never retried and a failed connect only once, so a
+# hung upstream holds a thread for at most a failed connect, a reconnect and
+# one read timeout: about 3 * ALPHA_VANTAGE_TIMEOUT (15s at the 5s default).
+# 429/5xx replies get up to three retries with 1.8s of backoff in total;
+# Retry-After is ignored so the server can't stretch that wait.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=3,
+        connect=1,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=False
+    )
+))
+
+# Request URLs for each endpoint, built once and filled with the quoted
+# symbol and API key on each call
+_BASE_URL = "https://www.alphavantage.co/query"
+_PRICE_URL = _BASE_URL + "?function=TIME_SERIES_DAILY&symbol={symbol}&apikey={api_key}"
+_OVERVIEW_URL = _BASE_URL + "?function=OVERVIEW&symbol={symbol}&apikey={api_key}"
+_HISTORICAL_URLS = {
+    outputsize: _BASE_URL + "?function=TIME_SERIES_DAILY&symbol={symbol}&outputsize=" + outputsize + "&apikey={api_key}"
+    for outputsize in ('compact', 'full')
+}
+
+# Number of data points in a 'compact' TIME_SERIES_DAILY response
+COMPACT_SIZE = 100
+
+# Pulls every field of a TIME_SERIES_DAILY bar in one call
+_BAR_FIELDS = itemgetter('1. open', '2. high', '3. low', '4. close', '5. volume')
+
+def _parse_bar(date, values):
+    """
+    Convert one TIME_SERIES_DAILY bar to the price dict used throughout the app
+    
+    Args:
+        date (str): The bar's trading date
+        values (dict): The raw bar from the API
+        
+    Returns:
+        dict: The bar's date, prices and volume
+    """
+    open_, high, low, close, volume = _BAR_FIELDS(values)
+    return {
+        'date': date,
+        'open': float(open_),
+        'high': float(high),
+        'low': float(low),
+        'close': float(close),
+        'volume': int(volume)
+    }
+
+# Worker threads shared by every concurrent Alpha Vantage lookup, which
+# also caps how many requests are in flight at once
+MAX_CONCURRENT_REQUESTS = 8
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix='stock-fetch')
+
+# Process-wide response cache shared by every StockAPI instance.
+# Maps a typed key such as ('price', symbol) to (data, stored_at).
+CACHE_DURATION = 15 * 60  # Cache data for 15 minutes
+# Company fundamentals change at most quarterly, so they are kept much
+# longer than prices; any kind not listed here uses CACHE_DURATION.
+CACHE_TTLS = {
+    'price': CACHE_DURATION,
+    'historical': CACHE_DURATION,
+    'info': 24 * 60 * 60,
+}
+CACHE_MAXSIZE = 1024
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+# ETag of the last response per cache key that carried one. Only the tag is
+# kept here: an expired _CACHE entry with a tag stays in place (still counted
+# against CACHE_MAXSIZE) so a 304 Not Modified can reuse its data, and the
+# tag is dropped whenever that entry is evicted.
+_ETAGS = {}
+
+# Outcome of validate_symbol per symbol as (is_valid, checked_at). Valid
+# symbols are remembered for the life of the process; invalid ones are
+# re-checked after INVALID_SYMBOL_TTL so a newly listed ticker is picked up.
+# A day is short enough for that and keeps repeated lookups of made-up
+# tickers from spending the API rate limit.
+INVALID_SYMBOL_TTL = 24 * 60 * 60
+SYMBOL_CHECKS_MAXSIZE = 10_000
+_SYMBOL_CHECKS = {}
+
+def _get_cached_data(cache_key):
+    """
+    Retrieve cached data if it exists and is still valid
+    
+    Args:
+        cache_key (tuple): The key to look up in cache
+        
+    Returns:
+        dict: Cached data if valid, None otherwise
+    """
+    with _CACHE_LOCK:
+        entry = _CACHE.get(cache_key)
+        if entry is None:
+            return None
+        data, stored_at = entry
+        if time.monotonic() - stored_at < CACHE_TTLS.get(cache_key[0], CACHE_DURATION):
+            logger.debug("Cache hit for %s", cache_key)
+            return data
+        logger.debug("Cache expired for %s", cache_key)
+        # Keep data that can still be revalidated with its ETag
+        if cache_key not in _ETAGS:
+            del _CACHE[cache_key]
+    return None
+
+def _cache_data(cache_key, data):
+    """
+    Store data in cache with current timestamp, evicting the oldest
+    entry once the cache is full
+    
+    Args:
+        cache_key (tuple): The key to store the data under
+        data (dict): The data to cache
+    """
+    with _CACHE_LOCK:
+        _CACHE.pop(cache_key, None)
+        if len(_CACHE) >= CACHE_MAXSIZE:
+            oldest_key = next(iter(_CACHE))
+            del _CACHE[oldest_key]
+            _ETAGS.pop(oldest_key, None)
+        _CACHE[cache_key] = (data, time.monotonic())
+    logger.debug("Cached data for %s", cache_key)
+
+class _InflightFetch:
+    """A cache-miss fetch in progress that concurrent callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Fetches currently in progress, keyed like _CACHE
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+def _fetch_once(cache_key, fetch, *args):
+    """
+    Return cached data for a key, or load and cache it with fetch(*args).
+    Concurrent misses for the same key share a single fetch, so a burst of
+    requests for one symbol after expiry makes one API call, not many.
+    
+    Args:
+        cache_key (tuple): The key to look up and store the data under
+        fetch (callable): Loads the data when it isn't cached
+        *args: Arguments passed to fetch
+        
+    Returns:
+        dict: The cached or freshly fetched data
+    """
+    cached_data = _get_cached_data(cache_key)
+    if cached_data:
+        return cached_data
+
+    with _INFLIGHT_LOCK:
+        inflight = _INFLIGHT.get(cache_key)
+        is_leader = inflight is None
+        if is_leader:
+            inflight = _INFLIGHT[cache_key] = _InflightFetch()
+
+    if not is_leader:
+        logger.debug("Waiting on in-flight fetch for %s", cache_key)
+        inflight.done.wait()
+        if inflight.error is not None:
+            raise inflight.error
+        return inflight.result
+
+    try:
+        # A fetch may have completed between the cache check and taking the lead
+        inflight.result = _get_cached_data(cache_key)
+        if not inflight.result:
+            inflight.result = fetch(*args)
+            _cache_data(cache_key, inflight.result)
+        return inflight.result
+    except Exception as e:
+        inflight.error = e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[cache_key]
+        inflight.done.set()
+
+def clear_cache():
+    """Drop every cached Alpha Vantage response, ETag and symbol check"""
+    with _CACHE_LOCK:
+        _CACHE.clear()
+        _ETAGS.clear()
+        _SYMBOL_CHECKS.clear()
+
+def _conditional_get(cache_key, url):
+    """
+    Request a URL, sending the ETag of the last response for the same
+    cache key so the server can skip the body if nothing has changed
+    
+    Args:
+        cache_key (tuple): The key the parsed response is cached under
+        url (str): The request URL
+        
+    Returns:
+        tuple: The response, and the previously parsed result if the
+            server answered 304 Not Modified (None otherwise)
+            
+    Raises:
+        requests.RequestException: If the request fails
+    """
+    with _CACHE_LOCK:
+        etag = _ETAGS.get(cache_key)
+        entry = _CACHE.get(cache_key) if etag else None
+    previous = entry[0] if entry is not None else None
+    if previous is None:
+        etag = None
+    headers = {'If-None-Match': etag} if etag else None
+    response = _SESSION.get(url, headers=headers, timeout=ALPHA_VANTAGE_TIMEOUT)
+    if response.status_code == 304 and previous is not None:
+        logger.debug("Not modified: %s", cache_key)
+        return response, previous
+    response.raise_for_status()
+    return response, None
+
+def _remember_etag(cache_key, response):
+    """
+    Keep a response's ETag for the next conditional request for its key,
+    or forget the old one if the response carried none
+    
+    Args:
+        cache_key (tuple): The key the parsed response is cached under
+        response (requests.Response): The response the result was parsed from
+    """
+    etag = response.headers.get('ETag')
+    with _CACHE_LOCK:
+        _ETAGS.pop(cache_key, None)
+        if etag:
+            if len(_ETAGS) >= CACHE_MAXSIZE:
+                del _ETAGS[next(iter(_ETAGS))]
+            _ETAGS[cache_key] = etag
+
+class RateLimitError(requests.RequestException):
+    """Alpha Vantage answered with a rate-limit notice instead of data"""
+
+class UnknownSymbolError(ValueError):
+    """Alpha Vantage reported that a symbol doesn't exist"""
+
+def _check_error_payload(data, symbol):
+    """
+    Raise for the error bodies Alpha Vantage sends with an HTTP 200
+    
+    Args:
+        data (dict): The decoded response
+        symbol (str): The stock symbol that was requested
+        
+    Raises:
+        RateLimitError: If the body is a rate-limit notice ("Note" or "Information")
+        UnknownSymbolError: If the body reports an invalid call ("Error Message")
+    """
+    if "Note" in data or "Information" in data:
+        logger.warning("Alpha Vantage rate limit hit for %s: %s", symbol, data)
+        raise RateLimitError(f"Alpha Vantage rate limit reached while requesting {symbol}")
+    if "Error Message" in data:
+        raise UnknownSymbolError(f"Invalid response for symbol {symbol}")
+
+# OVERVIEW fields that hold numbers, and the placeholders Alpha Vantage
+# sends when a value is unavailable
+_NUMERIC_FIELDS = frozenset([
+    'MarketCapitalization', 'EBITDA', 'PERatio', 'PEGRatio',
+    'BookValue', 'DividendPerShare', 'DividendYield', 'EPS',
+    'RevenuePerShareTTM', 'ProfitMargin', 'OperatingMarginTTM',
+    'ReturnOnAssetsTTM', 'ReturnOnEquityTTM', 'RevenueTTM',
+    'GrossProfitTTM', 'DilutedEPSTTM', 'QuarterlyEarningsGrowthYOY',
+    'QuarterlyRevenueGrowthYOY', 'AnalystTargetPrice', 'TrailingPE',
+    'ForwardPE', 'PriceToSalesRatioTTM', 'PriceToBookRatio',
+    'EVToRevenue', 'EVToEBITDA', 'Beta', '52WeekHigh', '52WeekLow',
+    '50DayMovingAverage', '200DayMovingAverage', 'SharesOutstanding'
+])
+_MISSING_VALUES = frozenset(['', 'None', '-', None])
+
+def _parse_numeric(field, value, symbol):
+    """
+    Convert a numeric OVERVIEW value, keeping the raw value if it isn't a number
+    
+    Args:
+        field (str): The name of the field being converted
+        value (str): The raw value from the API
+        symbol (str): The stock symbol, for logging
+        
+    Returns:
+        float: The converted value, or the raw value if conversion fails
+    """
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        logger.warning("Could not convert %s value '%s' for %s", field, value, symbol)
+        return value
+
 class StockAPI:
     def __init__(self):
         """
@@ -19,40 +329,7 @@ class StockAPI:
         if not self.api_key:
             raise ValueError("Alpha Vantage API key not found in environment variables")
         
-        self.base_url = "https://www.alphavantage.co/query"
-        self.cache = {}  # Simple in-memory cache for stock data
-        self.cache_duration = timedelta(minutes=15)  # Cache data for 15 minutes
-
-    def _get_cached_data(self, cache_key):
-        """
-        Retrieve cached data if it exists and is still valid
-        
-        Args:
-            cache_key (str): The key to look up in cache
-            
-        Returns:
-            dict: Cached data if valid, None otherwise
-        """
-        if cache_key in self.cache:
-            data, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < self.cache_duration:
-                logger.debug(f"Cache hit for {cache_key}")
-                return data
-            else:
-                logger.debug(f"Cache expired for {cache_key}")
-                del self.cache[cache_key]
-        return None
-
-    def _cache_data(self, cache_key, data):
-        """
-        Store data in cache with current timestamp
-        
-        Args:
-            cache_key (str): The key to store the data under
-            data (dict): The data to cache
-        """
-        self.cache[cache_key] = (data, datetime.now())
-        logger.debug(f"Cached data for {cache_key}")
+        self._quoted_api_key = quote(self.api_key, safe='')
 
     def get_stock_price(self, symbol):
         """
@@ -68,51 +345,80 @@ class StockAPI:
             requests.RequestException: If the API request fails
             ValueError: If the response is invalid
         """
-        cache_key = f"price_{symbol}"
-        cached_data = self._get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
+        return _fetch_once(('price', symbol), self._fetch_stock_price, symbol)
 
-        try:
-            params = {
-                'function': 'TIME_SERIES_DAILY',
-                'symbol': symbol,
-                'apikey': self.api_key
-            }
+    def _fetch_stock_price(self, symbol):
+        """
+        Request and parse the latest daily bar for a stock, bypassing the cache
+        
+        Args:
+            symbol (str): The stock symbol to look up
                 
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+        Returns:
+            dict: Latest stock price information
+        """
+        try:
+            cache_key = ('price', symbol)
+            url = _PRICE_URL.format(symbol=quote(symbol, safe=''), api_key=self._quoted_api_key)
+            response, unchanged = _conditional_get(cache_key, url)
+            if unchanged is not None:
+                return unchanged
+            data = orjson.loads(response.content)
+            _check_error_payload(data, symbol)
 
             if "Time Series (Daily)" not in data:
-                logger.error(f"Invalid response format for {symbol}: {data}")
+                logger.error("Invalid response format for %s: %s", symbol, data)
                 raise ValueError(f"Invalid response for symbol {symbol}")
 
             # Get the most recent day's data
             daily_data = data["Time Series (Daily)"]
-            latest_date = sorted(daily_data.keys())[-1]
-            latest_data = daily_data[latest_date]
+            latest_date = max(daily_data)
             
-            result = {
-                'symbol': symbol,
-                'date': latest_date,
-                'open': float(latest_data['1. open']),
-                'high': float(latest_data['2. high']),
-                'low': float(latest_data['3. low']),
-                'close': float(latest_data['4. close']),
-                'volume': int(latest_data['5. volume'])
-            }
+            result = {'symbol': symbol, **_parse_bar(latest_date, daily_data[latest_date])}
 
-            self._cache_data(cache_key, result)
+            _remember_etag(cache_key, response)
             return result
 
         except requests.RequestException as e:
-            logger.error(f"API request failed for {symbol}: {str(e)}")
+            logger.error("API request failed for %s: %s", symbol, e)
             raise
+        except UnknownSymbolError as e:
+            logger.error("Unknown symbol %s: %s", symbol, e)
+            raise UnknownSymbolError(f"Unable to get price for {symbol}")
         except (ValueError, KeyError) as e:
-            logger.error(f"Error parsing response for {symbol}: {str(e)}")
+            logger.error("Error parsing response for %s: %s", symbol, e)
             raise ValueError(f"Unable to get price for {symbol}")
 
+    def get_prices_bulk(self, symbols):
+        """
+        Get the current price data for several stocks at once. Cached
+        symbols are served from memory and the remaining ones are fetched
+        concurrently over the shared session.
+        
+        Args:
+            symbols (list): The stock symbols to look up
+                
+        Returns:
+            dict: Latest stock price information keyed by symbol
+                
+        Raises:
+            requests.RequestException: If an API request fails
+            ValueError: If a response is invalid
+        """
+        prices = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            cached_data = _get_cached_data(('price', symbol))
+            if cached_data:
+                prices[symbol] = cached_data
+            else:
+                missing.append(symbol)
+
+        if missing:
+            prices.update(zip(missing, FETCH_EXECUTOR.map(self.get_stock_price, missing)))
+
+        return prices
+
     def get_company_info(self, symbol):
         """
         Get detailed company information using OVERVIEW endpoint
@@ -127,58 +433,49 @@ class StockAPI:
             requests.RequestException: If the API request fails
             ValueError: If the response is invalid
         """
-        cache_key = f"info_{symbol}"
-        cached_data = self._get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
+        return _fetch_once(('info', symbol), self._fetch_company_info, symbol)
 
-        try:
-            params = {
-                'function': 'OVERVIEW',
-                'symbol': symbol,
-                'apikey': self.api_key
-            }
+    def _fetch_company_info(self, symbol):
+        """
+        Request and parse company information, bypassing the cache
+        
+        Args:
+            symbol (str): The stock symbol to look up
                 
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+        Returns:
+            dict: Company information as returned by the API
+        """
+        try:
+            cache_key = ('info', symbol)
+            url = _OVERVIEW_URL.format(symbol=quote(symbol, safe=''), api_key=self._quoted_api_key)
+            response, unchanged = _conditional_get(cache_key, url)
+            if unchanged is not None:
+                return unchanged
+            data = orjson.loads(response.content)
+            _check_error_payload(data, symbol)
 
             # Check if we got a valid response
             if not data or "Symbol" not in data:
-                logger.error(f"Invalid response format for {symbol}: {data}")
+                logger.error("Invalid response format for %s: %s", symbol, data)
                 raise ValueError(f"Invalid response for symbol {symbol}")
 
-            # Convert numeric values where appropriate
-            numeric_fields = [
-                'MarketCapitalization', 'EBITDA', 'PERatio', 'PEGRatio', 
-                'BookValue', 'DividendPerShare', 'DividendYield', 'EPS',
-                'RevenuePerShareTTM', 'ProfitMargin', 'OperatingMarginTTM',
-                'ReturnOnAssetsTTM', 'ReturnOnEquityTTM', 'RevenueTTM',
-                'GrossProfitTTM', 'DilutedEPSTTM', 'QuarterlyEarningsGrowthYOY',
-                'QuarterlyRevenueGrowthYOY', 'AnalystTargetPrice', 'TrailingPE',
-                'ForwardPE', 'PriceToSalesRatioTTM', 'PriceToBookRatio',
-                'EVToRevenue', 'EVToEBITDA', 'Beta', '52WeekHigh', '52WeekLow',
-                '50DayMovingAverage', '200DayMovingAverage', 'SharesOutstanding'
-            ]
-
-            result = data.copy()  # Start with a copy of all data
-            
-            # Convert numeric strings to appropriate types
-            for field in numeric_fields:
-                try:
-                    if field in result and result[field]:
-                        result[field] = float(result[field])
-                except (ValueError, TypeError):
-                    logger.warning(f"Could not convert {field} value '{result[field]}' for {symbol}")
-
-            self._cache_data(cache_key, result)
+            # Copy the response, converting numeric strings in the same pass;
+            # numeric fields Alpha Vantage has no value for become None
+            result = {
+                field: (value if field not in _NUMERIC_FIELDS
+                        else None if value in _MISSING_VALUES
+                        else _parse_numeric(field, value, symbol))
+                for field, value in data.items()
+            }
+
+            _remember_etag(cache_key, response)
             return result
 
         except requests.RequestException as e:
-            logger.error(f"API request failed for {symbol}: {str(e)}")
+            logger.error("API request failed for %s: %s", symbol, e)
             raise
         except (ValueError, KeyError) as e:
-            logger.error(f"Error parsing response for {symbol}: {str(e)}")
+            logger.error("Error parsing response for %s: %s", symbol, e)
             raise ValueError(f"Unable to get company info for {symbol}")
 
     def get_historical_data(self, symbol, outputsize='compact'):
@@ -198,25 +495,44 @@ class StockAPI:
             requests.RequestException: If the API request fails
             ValueError: If the response is invalid or parameters are incorrect
         """
-        cache_key = f"historical_{symbol}_{outputsize}"
-        cached_data = self._get_cached_data(cache_key)
+        cache_key = ('historical', symbol, outputsize)
+        cached_data = _get_cached_data(cache_key)
         if cached_data:
             return cached_data
 
+        # The compact series is the newest slice of the full one, so derive
+        # it locally instead of downloading and parsing it again. The slice
+        # is not cached itself so it can't outlive the full entry's TTL.
+        if outputsize == 'compact':
+            full_data = _get_cached_data(('historical', symbol, 'full'))
+            if full_data:
+                return {'symbol': symbol, 'data': full_data['data'][:COMPACT_SIZE]}
+
+        return _fetch_once(cache_key, self._fetch_historical_data, symbol, outputsize)
+
+    def _fetch_historical_data(self, symbol, outputsize):
+        """
+        Request and parse historical price data, bypassing the cache
+        
+        Args:
+            symbol (str): The stock symbol to look up
+            outputsize (str): Amount of data to retrieve ('compact' or 'full')
+            
+        Returns:
+            dict: Historical price data
+        """
         try:
             if outputsize not in ['compact', 'full']:
                 raise ValueError("outputsize must be either 'compact' or 'full'")
             
-            params = {
-                'function': 'TIME_SERIES_DAILY',
-                'symbol': symbol,
-                'outputsize': outputsize,
-                'apikey': self.api_key
-            }
-            
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            cache_key = ('historical', symbol, outputsize)
+            url = _HISTORICAL_URLS[outputsize].format(symbol=quote(symbol, safe=''), api_key=self._quoted_api_key)
+            response, unchanged = _conditional_get(cache_key, url)
+            if unchanged is not None:
+                return unchanged
+            # orjson decodes large historical series several times faster than json
+            data = orjson.loads(response.content)
+            _check_error_payload(data, symbol)
 
             if "Time Series (Daily)" not in data:
                 raise ValueError(f"Invalid response for symbol {symbol}")
@@ -224,24 +540,17 @@ class StockAPI:
             time_series = data["Time Series (Daily)"]
             result = {
                 'symbol': symbol,
-                'data': [{
-                    'date': date,
-                    'open': float(values['1. open']),
-                    'high': float(values['2. high']),
-                    'low': float(values['3. low']),
-                    'close': float(values['4. close']),
-                    'volume': int(values['5. volume'])
-                } for date, values in time_series.items()]
+                'data': [_parse_bar(date, values) for date, values in time_series.items()]
             }
 
-            self._cache_data(cache_key, result)
+            _remember_etag(cache_key, response)
             return result
 
         except requests.RequestException as e:
-            logger.error(f"API request failed for {symbol}: {str(e)}")
+            logger.error("API request failed for %s: %s", symbol, e)
             raise
         except (ValueError, KeyError) as e:
-            logger.error(f"Error parsing response for {symbol}: {str(e)}")
+            logger.error("Error parsing response for %s: %s", symbol, e)
             raise ValueError(f"Unable to get historical data for {symbol}")
 
     def validate_symbol(self, symbol):
@@ -254,8 +563,96 @@ class StockAPI:
         Returns:
             bool: True if valid, False otherwise
         """
+        with _CACHE_LOCK:
+            entry = _SYMBOL_CHECKS.get(symbol)
+        if entry is not None:
+            is_valid, checked_at = entry
+            if is_valid or time.monotonic() - checked_at < INVALID_SYMBOL_TTL:
+                return is_valid
+
         try:
             self.get_stock_price(symbol)
-            return True
+            is_valid = True
+        except UnknownSymbolError:
+            is_valid = False
         except (requests.RequestException, ValueError):
+            # A failed request, rate-limit notice or malformed reply says
+            # nothing about the symbol, so don't remember it
             return False
+
+        with _CACHE_LOCK:
+            _SYMBOL_CHECKS.pop(symbol, None)
+            if len(_SYMBOL_CHECKS) >= SYMBOL_CHECKS_MAXSIZE:
+                del _SYMBOL_CHECKS[next(iter(_SYMBOL_CHECKS))]
+            _SYMBOL_CHECKS[symbol] = (is_valid, time.monotonic())
+        return is_valid
+
+
+_stock_api = None
+_stock_api_lock = threading.Lock()
+
+def get_stock_api():
+    """
+    Get the process-wide StockAPI instance, creating it on first use
+    
+    Returns:
+        StockAPI: The shared StockAPI instance
+        
+    Raises:
+        ValueError: If the Alpha Vantage API key is not configured.
+    """
+    global _stock_api
+    if _stock_api is None:
+        with _stock_api_lock:
+            if _stock_api is None:
+                _stock_api = StockAPI()
+    return _stock_api
+
+
+_HELD_SYMBOLS_SQL = "SELECT DISTINCT symbol FROM portfolio WHERE quantity > 0"
+
+class PriceRefresher(threading.Thread):
+    """
+    Daemon thread that re-fetches the price of every held symbol on a fixed
+    interval, so portfolio views are served from a warm cache instead of
+    waiting on Alpha Vantage. Keep the interval below the price TTL and
+    mind the API key's rate limit.
+    """
+
+    def __init__(self, interval):
+        """
+        Args:
+            interval (float): Seconds to wait between refreshes
+        """
+        super().__init__(name='price-refresher', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def refresh(self):
+        """Fetch and cache the latest price for every symbol held by any user"""
+        symbols = [row['symbol'] for row in execute_read(_HELD_SYMBOLS_SQL)]
+        stock_api = get_stock_api()
+
+        def refresh_symbol(symbol):
+            try:
+                _cache_data(('price', symbol), stock_api._fetch_stock_price(symbol))
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Price refresh failed for %s: %s", symbol, e)
+
+        # Consume the iterator so every symbol has finished before returning
+        list(FETCH_EXECUTOR.map(refresh_symbol, symbols))
+        logger.debug("Refreshed prices for %d symbols", len(symbols))
+
+    def run(self):
+        # Refresh straight away so the cache is warm from startup, then on every interval
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Price refresh failed: %s", e)
+            if self._stopped.wait(self.interval):
+                break
+
+    def stop(self):
+        """Ask the thread to exit before its next refresh"""
+        self._stopped.set()
@@ -1,33 +1,162 @@
 import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
 import bcrypt
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
+from app.config import BCRYPT_ROUNDS
 from app.utils.logger import configure_logger
 from app.utils.sql_utils import get_db_connection
-from app.models.portfolio import PortfolioManager
+from app.models.portfolio import DEFAULT_HISTORY_LIMIT, get_portfolio_manager
 
 logger = logging.getLogger(__name__)
 configure_logger(logger)
 
+# SQL is defined once so every call reuses the same text and hits the
+# connection's prepared-statement cache
+# username is selected too: the lookup ignores case, so the User should carry
+# the name as stored rather than as typed
+_LOGIN_SQL = "SELECT id, username, password_hash FROM users WHERE username = ?"
+_TOUCH_LAST_LOGIN_SQL = "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?"
+_INSERT_USER_SQL = "INSERT INTO users (username, password_hash) VALUES (?, ?)"
+# Only replaces the hash the current password was checked against; another
+# worker's cache may still hold a hash that has since been changed
+_UPDATE_PASSWORD_SQL = "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?"
+_GET_BY_ID_SQL = "SELECT id, username, password_hash FROM users WHERE id = ?"
+_USER_EXISTS_SQL = "SELECT 1 FROM users WHERE id = ?"
+
+# bcrypt releases the GIL, so hashes already run in parallel across threads;
+# capping them at the core count stops a burst of logins from starving
+# every other request of CPU
+_BCRYPT_SLOTS = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+def _hashpw(password: str) -> bytes:
+    """Hash a password with a fresh salt, waiting for a free bcrypt slot."""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    with _BCRYPT_SLOTS:
+        return bcrypt.hashpw(password.encode('utf-8'), salt)
+
+def _checkpw(password: str, hashed_password: bytes) -> bool:
+    """Check a password against a hash, waiting for a free bcrypt slot."""
+    with _BCRYPT_SLOTS:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+# Checked against when a username doesn't exist, so unknown and known
+# usernames take the same bcrypt time to reject
+_DUMMY_HASH = bcrypt.hashpw(b'dummy-password', bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+# Recently loaded users, keyed by id, so repeat lookups skip the database
+USER_CACHE_TTL = 60
+USER_CACHE_MAXSIZE = 2048
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def _get_cached_user(user_id: int) -> Optional[tuple]:
+    """
+    Return a user's cached (id, username, password_hash), if still fresh.
+
+    Args:
+        user_id (int): The user's unique ID.
+
+    Returns:
+        Optional[tuple]: The cached row, or None on a miss or expiry.
+    """
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() < entry[1]:
+            return entry[0]
+        del _user_cache[user_id]
+        return None
+
+def _cache_user(user_id: int, row: tuple) -> None:
+    """
+    Cache a user's row, evicting the oldest entry when the cache is full.
+
+    Args:
+        user_id (int): The user's unique ID.
+        row (tuple): The (id, username, password_hash) row.
+    """
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+        if len(_user_cache) >= USER_CACHE_MAXSIZE:
+            del _user_cache[next(iter(_user_cache))]
+        _user_cache[user_id] = (row, time.monotonic() + USER_CACHE_TTL)
+
+def clear_user_cache() -> None:
+    """Drop every cached user."""
+    with _user_cache_lock:
+        _user_cache.clear()
+
+# last_login is bookkeeping only, so logins queue it for a background writer
+# that commits a batch at most once per interval instead of once per login
+LAST_LOGIN_FLUSH_INTERVAL = 1.0
+_last_logins = queue.SimpleQueue()
+_last_login_writer = None
+_last_login_writer_lock = threading.Lock()
+
+def _record_login(user_id: int) -> None:
+    """
+    Queue a last_login update for a user, starting the writer thread if needed.
+
+    Args:
+        user_id (int): The ID of the user who logged in.
+    """
+    global _last_login_writer
+    if _last_login_writer is None:
+        with _last_login_writer_lock:
+            if _last_login_writer is None:
+                _last_login_writer = threading.Thread(
+                    target=_write_last_logins, name='last-login-writer', daemon=True
+                )
+                _last_login_writer.start()
+    _last_logins.put(user_id)
+
+def _write_last_logins() -> None:
+    """Drain queued logins forever, flushing them in batches."""
+    while True:
+        user_ids = {_last_logins.get()}
+        time.sleep(LAST_LOGIN_FLUSH_INTERVAL)
+        while not _last_logins.empty():
+            user_ids.add(_last_logins.get_nowait())
+        # Nothing restarts this thread, so no error may escape the loop
+        try:
+            _flush_last_logins(user_ids)
+        except sqlite3.Error as e:
+            logger.error("Database error while recording logins: %s", str(e))
+        except Exception as e:
+            logger.error("Unexpected error while recording logins: %s", str(e))
+
+def _flush_last_logins(user_ids) -> None:
+    """
+    Set last_login for a batch of users in a single transaction.
+
+    Args:
+        user_ids (Iterable[int]): The IDs of the users to update.
+    """
+    with get_db_connection() as conn:
+        conn.executemany(_TOUCH_LAST_LOGIN_SQL, [(user_id,) for user_id in user_ids])
+        conn.commit()
+
 class User:
     """User class to manage user authentication and portfolio interactions"""
     
-    def __init__(self, id: int, username: str, salt: bytes, hashed_password: bytes):
+    def __init__(self, id: int, username: str, hashed_password: bytes):
         """
         Initialize a User instance.
 
         Args:
             id (int): The user's unique identifier.
             username (str): The user's username.
-            salt (bytes): The salt used for hashing the password.
-            hashed_password (bytes): The hashed password.
+            hashed_password (bytes): The bcrypt hash, which embeds its own salt.
         """
         self.id = id
         self.username = username
-        self._salt = salt
         self._hashed_password = hashed_password
-        self._portfolio_manager = PortfolioManager()
 
     @classmethod
     def login(cls, username: str, password: str) -> 'User':
@@ -48,40 +177,37 @@ class User:
         try:
             with get_db_connection() as conn:
                 cursor = conn.cursor()
+                # Plain tuples: the columns are unpacked by position below
+                cursor.row_factory = None
                 logger.info("Attempting to login user with username %s", username)
 
-                cursor.execute(
-                    "SELECT id, salt, password_hash FROM users WHERE username = ?", 
-                    (username,)
-                )
+                cursor.execute(_LOGIN_SQL, (username,))
                 row = cursor.fetchone()
 
-                if not row:
-                    logger.warning("User with username %s not found", username)
-                    raise ValueError("Invalid username or password")
-
-                user_id, salt, stored_hash = row['id'], row['salt'], row['password_hash']
-                
-                # Verify password
-                if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
-                    logger.info("Successfully logged in user: %s", username)
-                    
-                    # Update last login timestamp
-                    cursor.execute(
-                        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?",
-                        (user_id,)
-                    )
-                    conn.commit()
-                    
-                    return cls(user_id, username, salt, stored_hash)
-                else:
-                    logger.warning("Invalid password attempt for user: %s", username)
-                    raise ValueError("Invalid username or password")
-
         except sqlite3.Error as e:
             logger.error("Database error during login: %s", str(e))
             raise
 
+        # The password check runs after the connection is back in the pool
+        if not row:
+            logger.warning("User with username %s not found", username)
+            _checkpw(password, _DUMMY_HASH)
+            raise ValueError("Invalid username or password")
+
+        user_id, stored_username, stored_hash = row
+        
+        # Verify password
+        if _checkpw(password, stored_hash):
+            logger.info("Successfully logged in user: %s", username)
+            
+            # Update last login timestamp off the request path
+            _record_login(user_id)
+            
+            return cls(user_id, stored_username, stored_hash)
+        else:
+            logger.warning("Invalid password attempt for user: %s", username)
+            raise ValueError("Invalid username or password")
+
     @classmethod
     def create(cls, username: str, password: str) -> 'User':
         """
@@ -102,22 +228,18 @@ class User:
             raise ValueError("Username and password are required")
 
         try:
-            salt = bcrypt.gensalt()
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), salt)
+            password_hash = _hashpw(password)
 
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    INSERT INTO users (username, password_hash, salt)
-                    VALUES (?, ?, ?)
-                """, (username, password_hash, salt))
+                cursor.execute(_INSERT_USER_SQL, (username, password_hash))
                 
                 user_id = cursor.lastrowid
                 conn.commit()
                 
                 logger.info("Successfully created new user: %s", username)
-                return cls(user_id, username, salt, password_hash)
+                return cls(user_id, username, password_hash)
 
         except sqlite3.IntegrityError as e:
             logger.error("Failed to create user - username '%s' already exists", username)
@@ -138,22 +260,25 @@ class User:
             ValueError: If the current password is incorrect.
             sqlite3.Error: If a database error occurs.
         """
-        if not bcrypt.checkpw(current_password.encode('utf-8'), self._hashed_password):
+        if not _checkpw(current_password, self._hashed_password):
             raise ValueError("Current password is incorrect")
 
         try:
-            new_salt = bcrypt.gensalt()
-            new_hash = bcrypt.hashpw(new_password.encode('utf-8'), new_salt)
+            new_hash = _hashpw(new_password)
             
             with get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE users SET password_hash = ?, salt = ? WHERE id = ?",
-                    (new_hash, new_salt, self.id)
-                )
+                cursor.execute(_UPDATE_PASSWORD_SQL, (new_hash, self.id, self._hashed_password))
+                updated = cursor.rowcount
                 conn.commit()
             
-            self._salt = new_salt
+            with _user_cache_lock:
+                _user_cache.pop(self.id, None)
+            if updated == 0:
+                # The password was changed elsewhere after this hash was loaded
+                logger.warning("Stale password hash for user: %s", self.username)
+                raise ValueError("Current password is incorrect")
+
             self._hashed_password = new_hash
             logger.info("Successfully updated password for user: %s", self.username)
 
@@ -163,13 +288,13 @@ class User:
 
     # Portfolio methods
     def get_portfolio(self) -> Dict:
-         """
+        """
         Retrieve the user's portfolio with real-time stock values.
 
         Returns:
             Dict: A dictionary containing the user's portfolio details.
         """
-        return self._portfolio_manager.get_portfolio(self.id)
+        return get_portfolio_manager().get_portfolio(self.id)
 
     def buy_stock(self, symbol: str, quantity: int) -> Dict:
         """
@@ -182,7 +307,7 @@ class User:
         Returns:
             Dict: A dictionary with details of the transaction.
         """
-        return self._portfolio_manager.buy_stock(self.id, symbol, quantity)
+        return get_portfolio_manager().buy_stock(self.id, symbol, quantity)
 
     def sell_stock(self, symbol: str, quantity: int) -> Dict:
         """
@@ -195,33 +320,73 @@ class User:
         Returns:
             Dict: A dictionary with details of the transaction.
         """
-        return self._portfolio_manager.sell_stock(self.id, symbol, quantity)
+        return get_portfolio_manager().sell_stock(self.id, symbol, quantity)
 
-    def get_transaction_history(self) -> Dict:
-       """
-        Retrieve the user's transaction history.
+    def get_transaction_history(self, limit: int = DEFAULT_HISTORY_LIMIT, offset: int = 0,
+                                symbol: Optional[str] = None) -> List[sqlite3.Row]:
+        """
+        Retrieve one page of the user's transaction history, newest first.
+
+        Args:
+            limit (int): Maximum number of transactions to return.
+            offset (int): Number of newer transactions to skip.
+            symbol (Optional[str]): Only return transactions for this stock symbol.
 
         Returns:
-            Dict: A dictionary containing the transaction history.
+            List[sqlite3.Row]: Transaction rows, readable by column name.
         """
-        return self._portfolio_manager.get_transaction_history(self.id)
+        return get_portfolio_manager().get_transaction_history(self.id, limit, offset, symbol)
 
     @staticmethod
-    def get_stock_info(symbol: str) -> Dict:
+    def get_stock_info(symbol: str, include_company: bool = True,
+                       include_historical: bool = False) -> Dict:
         """
         Retrieve detailed information about a specific stock.
 
         Args:
             symbol (str): The stock symbol.
+            include_company (bool): Whether to include company info.
+            include_historical (bool): Whether to include historical data.
 
         Returns:
             Dict: A dictionary containing stock information.
         """
-        return PortfolioManager().get_stock_info(symbol)
+        return get_portfolio_manager().get_stock_info(
+            symbol,
+            include_company=include_company,
+            include_historical=include_historical
+        )
+
+    @staticmethod
+    def exists(user_id: int) -> bool:
+        """
+        Check whether a user ID exists without loading the user.
+
+        Args:
+            user_id (int): The user's unique ID.
+
+        Returns:
+            bool: True if the user exists, otherwise False.
+
+        Raises:
+            sqlite3.Error: If a database error occurs.
+        """
+        if _get_cached_user(user_id):
+            return True
+
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(_USER_EXISTS_SQL, (user_id,))
+                return cursor.fetchone() is not None
+
+        except sqlite3.Error as e:
+            logger.error("Database error while checking user: %s", str(e))
+            raise
 
     @staticmethod
     def get_by_id(user_id: int) -> Optional['User']:
-         """
+        """
         Retrieve a User instance by their ID.
 
         Args:
@@ -233,24 +398,23 @@ class User:
         Raises:
             sqlite3.Error: If a database error occurs.
         """
+        cached_row = _get_cached_user(user_id)
+        if cached_row:
+            return User(*cached_row)
+
         try:
             with get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, username, salt, password_hash FROM users WHERE id = ?",
-                    (user_id,)
-                )
+                # A plain (id, username, password_hash) tuple is cached as-is
+                cursor.row_factory = None
+                cursor.execute(_GET_BY_ID_SQL, (user_id,))
                 row = cursor.fetchone()
                 
                 if not row:
                     return None
-                    
-                return User(
-                    id=row['id'],
-                    username=row['username'],
-                    salt=row['salt'],
-                    hashed_password=row['password_hash']
-                )
+
+                _cache_user(user_id, row)
+                return User(*row)
 
         except sqlite3.Error as e:
             logger.error("Database error while retrieving user: %s", str(e))
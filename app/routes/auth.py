@@ -11,7 +11,7 @@ def create_account() -> Response:
         Response: A JSON response with success or error details.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=False) or {}
         username = data.get('username')
         password = data.get('password')
 
@@ -39,7 +39,7 @@ def login() -> Response:
         Response: A JSON response indicating success or failure.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=False) or {}
         username = data.get('username')
         password = data.get('password')
 
@@ -61,13 +61,13 @@ def login() -> Response:
 
 @auth_bp.route('/users/update-password', methods=['POST'])
 def update_password() -> Response:
-     """
+    """
     Update a user's password.
     Returns:
         Response: A JSON response indicating success or failure.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=False) or {}
         user_id = data.get('user_id')
         current_password = data.get('current_password')
         new_password = data.get('new_password')
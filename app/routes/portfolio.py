@@ -1,17 +1,68 @@
+from typing import Optional
+
 from flask import Blueprint, jsonify, make_response, request, Response
+from app.models.portfolio import DEFAULT_HISTORY_LIMIT, MAX_HISTORY_LIMIT, get_portfolio_manager
 from app.models.user import User
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
+def _parse_quantity(quantity) -> Optional[int]:
+    """
+    Convert a request's quantity to a positive int.
+
+    Returns:
+        Optional[int]: The quantity, or None if it isn't a positive whole number.
+    """
+    # bool is an int subclass, and int() would silently truncate 2.7 to 2
+    if isinstance(quantity, bool):
+        return None
+    if isinstance(quantity, float):
+        if not quantity.is_integer():
+            return None
+    elif not isinstance(quantity, (int, str)):
+        return None
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
+
+def _parse_symbol(symbol) -> Optional[str]:
+    """
+    Check a request's stock symbol.
+
+    Returns:
+        Optional[str]: The symbol without surrounding whitespace, or None if
+            it isn't a non-empty string.
+    """
+    if not isinstance(symbol, str):
+        return None
+    return symbol.strip() or None
+
+def _parse_int_arg(name: str, default: int) -> Optional[int]:
+    """
+    Read an integer query parameter.
+
+    Returns:
+        Optional[int]: The value, the default if the parameter is absent,
+            or None if it isn't an integer.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
 @portfolio_bp.route('/portfolio/<int:user_id>', methods=['GET'])
 def get_portfolio(user_id: int) -> Response:
     """Get user's portfolio"""
     try:
-        user = User.get_by_id(user_id)
-        if not user:
+        if not User.exists(user_id):
             return make_response(jsonify({'error': 'User not found'}), 404)
 
-        portfolio = user.get_portfolio()
+        portfolio = get_portfolio_manager().get_portfolio(user_id)
         return make_response(jsonify({
             'status': 'success',
             'portfolio': portfolio
@@ -23,7 +74,7 @@ def get_portfolio(user_id: int) -> Response:
 def buy_stock() -> Response:
     """Buy stock for user's portfolio"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=False) or {}
         user_id = data.get('user_id')
         symbol = data.get('symbol')
         quantity = data.get('quantity')
@@ -33,11 +84,22 @@ def buy_stock() -> Response:
                 'error': 'user_id, symbol, and quantity are required'
             }), 400)
 
-        user = User.get_by_id(user_id)
-        if not user:
+        symbol = _parse_symbol(symbol)
+        if symbol is None:
+            return make_response(jsonify({
+                'error': 'symbol must be a non-empty string'
+            }), 400)
+
+        quantity = _parse_quantity(quantity)
+        if quantity is None:
+            return make_response(jsonify({
+                'error': 'quantity must be a positive integer'
+            }), 400)
+
+        if not User.exists(user_id):
             return make_response(jsonify({'error': 'User not found'}), 404)
 
-        transaction = user.buy_stock(symbol, int(quantity))
+        transaction = get_portfolio_manager().buy_stock(user_id, symbol, quantity)
         return make_response(jsonify({
             'status': 'success',
             'transaction': transaction
@@ -51,7 +113,7 @@ def buy_stock() -> Response:
 def sell_stock() -> Response:
     """Sell stock from user's portfolio"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=False) or {}
         user_id = data.get('user_id')
         symbol = data.get('symbol')
         quantity = data.get('quantity')
@@ -61,11 +123,22 @@ def sell_stock() -> Response:
                 'error': 'user_id, symbol, and quantity are required'
             }), 400)
 
-        user = User.get_by_id(user_id)
-        if not user:
+        symbol = _parse_symbol(symbol)
+        if symbol is None:
+            return make_response(jsonify({
+                'error': 'symbol must be a non-empty string'
+            }), 400)
+
+        quantity = _parse_quantity(quantity)
+        if quantity is None:
+            return make_response(jsonify({
+                'error': 'quantity must be a positive integer'
+            }), 400)
+
+        if not User.exists(user_id):
             return make_response(jsonify({'error': 'User not found'}), 404)
 
-        transaction = user.sell_stock(symbol, int(quantity))
+        transaction = get_portfolio_manager().sell_stock(user_id, symbol, quantity)
         return make_response(jsonify({
             'status': 'success',
             'transaction': transaction
@@ -77,13 +150,21 @@ def sell_stock() -> Response:
 
 @portfolio_bp.route('/portfolio/history/<int:user_id>', methods=['GET'])
 def get_transaction_history(user_id: int) -> Response:
-    """Get user's transaction history"""
+    """Get a page of user's transaction history"""
     try:
-        user = User.get_by_id(user_id)
-        if not user:
+        limit = _parse_int_arg('limit', DEFAULT_HISTORY_LIMIT)
+        offset = _parse_int_arg('offset', 0)
+        symbol = request.args.get('symbol')
+
+        if limit is None or offset is None or not 0 < limit <= MAX_HISTORY_LIMIT or offset < 0:
+            return make_response(jsonify({
+                'error': f'limit must be between 1 and {MAX_HISTORY_LIMIT} and offset must not be negative'
+            }), 400)
+
+        if not User.exists(user_id):
             return make_response(jsonify({'error': 'User not found'}), 404)
 
-        history = user.get_transaction_history()
+        history = get_portfolio_manager().get_transaction_history(user_id, limit, offset, symbol)
         return make_response(jsonify({
             'status': 'success',
             'history': history
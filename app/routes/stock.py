@@ -1,14 +1,13 @@
 from flask import Blueprint, jsonify, make_response, request, Response
-from app.models.stock import StockAPI
+from app.models.stock import get_stock_api
 
 stock_bp = Blueprint('stock', __name__)
-stock_api = StockAPI()
 
 @stock_bp.route('/stock/<symbol>', methods=['GET'])
 def validate_stock(symbol: str) -> Response:
     """Validate if a stock symbol exists"""
     try:
-        is_valid = stock_api.validate_symbol(symbol)
+        is_valid = get_stock_api().validate_symbol(symbol)
         return make_response(jsonify({
             'status': 'success',
             'valid': is_valid
@@ -20,7 +19,7 @@ def validate_stock(symbol: str) -> Response:
 def get_stock_price(symbol: str) -> Response:
     """Get current stock price"""
     try:
-        price_info = stock_api.get_stock_price(symbol)
+        price_info = get_stock_api().get_stock_price(symbol)
         return make_response(jsonify({
             'status': 'success',
             'price_info': price_info
@@ -40,7 +39,7 @@ def get_stock_history(symbol: str) -> Response:
                 'error': 'outputsize must be either compact or full'
             }), 400)
 
-        history = stock_api.get_historical_data(symbol, outputsize=outputsize)
+        history = get_stock_api().get_historical_data(symbol, outputsize=outputsize)
         return make_response(jsonify({
             'status': 'success',
             'history': history
@@ -54,7 +53,7 @@ def get_stock_history(symbol: str) -> Response:
 def get_company_info(symbol: str) -> Response:
     """Get detailed company information"""
     try:
-        company_info = stock_api.get_company_info(symbol)
+        company_info = get_stock_api().get_company_info(symbol)
         return make_response(jsonify({
             'status': 'success',
             'company_info': company_info
@@ -1,6 +1,8 @@
+import atexit
 from contextlib import contextmanager
 import logging
 import os
+import queue
 import sqlite3
 from app.utils.logger import configure_logger
 
@@ -10,6 +12,21 @@ configure_logger(logger)
 # load the db path from the environment with a default value
 DB_PATH = os.getenv("DB_PATH", "./sql/stock_trading.db")
 
+# Idle connections kept open between requests; size it to the server's thread count
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# WAL lets readers proceed while a write is in progress; tests that use a
+# throwaway database switch to MEMORY/OFF since durability doesn't matter there
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+
+# journal_mode=WAL persists in the database file, so it only needs setting once;
+# any other mode is per connection
+_journal_mode_set = False
+
+_TABLES_SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (?, ?, ?)"
+
 def check_database_connection():
     """Check the database connection
     
@@ -33,32 +50,71 @@ def check_tables_exist():
     Raises:
         Exception: If any required table does not exist
     """
-    required_tables = ['users', 'portfolio', 'transactions']
+    required_tables = ('users', 'portfolio', 'transactions')
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        for table in required_tables:
-            try:
-                cursor.execute(f"SELECT 1 FROM {table} LIMIT 1;")
-                logger.info(f"Table '{table}' exists")
-            except sqlite3.Error as e:
-                error_message = f"Table '{table}' check error: {e}"
-                logger.error(error_message)
-                raise Exception(error_message) from e
-                
-        conn.close()
+        with get_db_connection() as conn:
+            # One catalog lookup instead of reading a page from every table
+            cursor = conn.execute(_TABLES_SQL, required_tables)
+            found_tables = {row[0] for row in cursor}
     except sqlite3.Error as e:
         error_message = f"Database check error: {e}"
         logger.error(error_message)
         raise Exception(error_message) from e
 
+    missing_tables = [table for table in required_tables if table not in found_tables]
+    if missing_tables:
+        error_message = f"Missing tables: {', '.join(missing_tables)}"
+        logger.error(error_message)
+        raise Exception(error_message)
+    logger.debug("All required tables exist")
+
+def _connect():
+    """
+    Open a new SQLite connection with the pragmas used for every request.
+    
+    Returns:
+        sqlite3.Connection: The configured connection.
+    """
+    global _journal_mode_set
+    # Model SQL lives in module constants, so a larger statement cache keeps
+    # every prepared statement warm for the life of the connection
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                           cached_statements=256)
+    # Enable foreign key constraints
+    conn.execute("PRAGMA foreign_keys = ON")
+    if not _journal_mode_set or DB_JOURNAL_MODE != "WAL":
+        conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+        _journal_mode_set = True
+    # Wait up to 5s for a competing writer instead of failing straight away
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Return dictionary-like objects for rows
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _close_all():
+    """Close every idle connection in the pool."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+atexit.register(_close_all)
+
 @contextmanager
 def get_db_connection():
     """
     Context manager for SQLite database connection.
     
+    Connections are borrowed from a pool and returned afterwards instead of
+    reconnecting every time. On exit any open transaction is committed,
+    or rolled back if the block raised. A connection is only closed when
+    the pool is already full.
+    
     Yields:
         sqlite3.Connection: The SQLite connection object.
     
@@ -67,25 +123,34 @@ def get_db_connection():
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users")
     """
-    conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        # Enable foreign key constraints
-        conn.execute("PRAGMA foreign_keys = ON")
-        # Return dictionary-like objects for rows
-        conn.row_factory = sqlite3.Row
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        try:
+            conn = _connect()
+        except sqlite3.Error as e:
+            logger.error("Database connection error: %s", str(e))
+            raise e
+
+    try:
         yield conn
-    except sqlite3.Error as e:
-        logger.error("Database connection error: %s", str(e))
-        raise e
+        if conn.in_transaction:
+            conn.commit()
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        if isinstance(e, sqlite3.Error):
+            logger.error("Database error: %s", str(e))
+        raise
     finally:
-        if conn:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
             conn.close()
-            logger.info("Database connection closed.")
 
-def execute_query(query, params=None):
+def execute_read(query, params=None):
     """
-    Execute a SQL query and return the results.
+    Run a read-only SQL query and return its rows.
     
     Args:
         query (str): The SQL query to execute
@@ -98,17 +163,32 @@ def execute_query(query, params=None):
         sqlite3.Error: If there's a database error
     """
     with get_db_connection() as conn:
-        cursor = conn.cursor()
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            return conn.execute(query, params or ()).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Query execution error: %s\nQuery: %s\nParameters: %s", e, query, params)
+            raise
+
+def execute_write(query, params=None):
+    """
+    Run a single SQL write and commit it.
+    
+    Args:
+        query (str): The SQL statement to execute
+        params (tuple, optional): Parameters for the statement. Defaults to None.
+    
+    Returns:
+        int: The number of rows changed
+        
+    Raises:
+        sqlite3.Error: If there's a database error
+    """
+    with get_db_connection() as conn:
+        try:
+            cursor = conn.execute(query, params or ())
             conn.commit()
-            return cursor.fetchall()
+            return cursor.rowcount
         except sqlite3.Error as e:
             conn.rollback()
-            logger.error(f"Query execution error: {e}")
-            logger.error(f"Query: {query}")
-            logger.error(f"Parameters: {params}")
-            raise
\ No newline at end of file
+            logger.error("Query execution error: %s\nQuery: %s\nParameters: %s", e, query, params)
+            raise
@@ -13,5 +13,11 @@ else
     echo "Skipping database creation."
 fi
 
-# Start the Python application
-exec python3 run.py
\ No newline at end of file
+# Start the application under gunicorn with threaded workers so slow
+# Alpha Vantage calls don't block other requests
+exec gunicorn \
+    --bind 0.0.0.0:5001 \
+    --worker-class gthread \
+    --workers "${GUNICORN_WORKERS:-2}" \
+    --threads "${GUNICORN_THREADS:-8}" \
+    app:app
\ No newline at end of file
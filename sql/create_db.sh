@@ -12,4 +12,7 @@ else
     sqlite3 "$DB_PATH" < /app/sql/create_users_table.sql
     sqlite3 "$DB_PATH" < /app/sql/create_portfolio_table.sql
     echo "Database created successfully."
-fi
\ No newline at end of file
+fi
+
+# WAL mode is stored in the database file, so the app doesn't set it per connection
+sqlite3 "$DB_PATH" "PRAGMA journal_mode=WAL;"
\ No newline at end of file
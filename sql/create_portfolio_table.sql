@@ -20,4 +20,7 @@ CREATE TABLE transactions (
     transaction_type TEXT CHECK(transaction_type IN ('BUY', 'SELL')),
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id)
-);
\ No newline at end of file
+);
+
+-- id breaks ties between trades in the same second, so history pages have a fixed order
+CREATE INDEX IF NOT EXISTS idx_transactions_user_timestamp ON transactions(user_id, timestamp DESC, id DESC);
\ No newline at end of file
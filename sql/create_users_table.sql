@@ -1,10 +1,11 @@
 DROP TABLE IF EXISTS users;
 CREATE TABLE users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT NOT NULL UNIQUE,
+    -- UNIQUE gives login's username lookup an index (sqlite_autoindex_users_1);
+    -- NOCASE makes both the lookup and uniqueness case-insensitive
+    username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    -- bcrypt hashes embed their own salt
     password_hash TEXT NOT NULL,
-    salt TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_login TIMESTAMP,
-    UNIQUE(username)
+    last_login TIMESTAMP
 );
\ No newline at end of file
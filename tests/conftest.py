@@ -0,0 +1,49 @@
+import os
+import queue
+import sqlite3
+from pathlib import Path
+import pytest
+
+# app.config reads these when it is first imported, so they have to be set
+# before any test module imports the app.
+
+# bcrypt's minimum work factor keeps hashing in User.create, login and
+# update_password fast; no test depends on the production cost.
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+# StockAPI refuses to start without a key; every HTTP call is mocked in tests.
+os.environ.setdefault('ALPHA_VANTAGE_API_KEY', 'test')
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'sql'
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    """Start every test with empty process-wide caches so results don't depend
+    on test order or on which xdist worker runs them"""
+    from app.models.stock import clear_cache
+    from app.models.user import clear_user_cache
+
+    clear_cache()
+    clear_user_cache()
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Point the connection pool at a fresh database built from the sql/ scripts
+
+    Each pooled connection opens the same file, which ':memory:' can't offer,
+    but with an in-memory journal and synchronous=OFF nothing waits on disk.
+    """
+    from app.utils import sql_utils
+
+    db_path = str(tmp_path / 'stock_trading.db')
+    conn = sqlite3.connect(db_path)
+    for script in ('create_users_table.sql', 'create_portfolio_table.sql'):
+        conn.executescript((SQL_DIR / script).read_text())
+    conn.close()
+
+    monkeypatch.setattr(sql_utils, 'DB_PATH', db_path)
+    monkeypatch.setattr(sql_utils, 'DB_JOURNAL_MODE', 'MEMORY')
+    monkeypatch.setattr(sql_utils, 'DB_SYNCHRONOUS', 'OFF')
+    monkeypatch.setattr(sql_utils, '_pool', queue.LifoQueue(maxsize=sql_utils.DB_POOL_SIZE))
+    yield db_path
+    sql_utils._close_all()
@@ -0,0 +1,18 @@
+"""Shared test doubles"""
+
+
+class MockConnectionContext:
+    """Stands in for get_db_connection; calling it gives a context that yields the mock connection"""
+    __slots__ = ('conn',)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc_info):
+        return False
@@ -1,35 +1,35 @@
-from contextlib import contextmanager
 import pytest
 import bcrypt
 import sqlite3
-from app.models.user import User
+import threading
+from app.models.user import User, _flush_last_logins, _record_login
+from tests.helpers import MockConnectionContext
 
 @pytest.fixture
-def mock_db_connection(mocker):
+def mock_db_connection(mocker, monkeypatch):
     """Mock database connection for testing"""
-    mock_conn = mocker.Mock()
-    mock_cursor = mocker.Mock()
+    mock_conn = mocker.Mock(spec=sqlite3.Connection)
+    mock_cursor = mocker.Mock(spec=sqlite3.Cursor)
     mock_conn.cursor.return_value = mock_cursor
     mock_cursor.fetchone.return_value = None
     mock_cursor.fetchall.return_value = []
+    mock_cursor.rowcount = 1
     mock_conn.commit.return_value = None
 
-    # Create mock context manager
-    @contextmanager
-    def mock_get_db_connection():
-        yield mock_conn
-
-    mocker.patch("app.models.user.get_db_connection", mock_get_db_connection)
+    monkeypatch.setattr("app.models.user.get_db_connection", MockConnectionContext(mock_conn))
     return mock_cursor
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_user_data():
-    """Sample user data for testing"""
+    """Sample user data for testing, hashed once per session at the minimum bcrypt cost"""
+    password = 'testpass123'
+    salt = bcrypt.gensalt(rounds=4)
     return {
         'id': 1,
         'username': 'testuser',
-        'password': 'testpass123',
-        'salt': bcrypt.gensalt(),
+        'password': password,
+        'salt': salt,
+        'hashed': bcrypt.hashpw(password.encode('utf-8'), salt),
     }
 
 def test_user_creation(sample_user_data):
@@ -37,11 +37,7 @@ def test_user_creation(sample_user_data):
     user = User(
         id=sample_user_data['id'],
         username=sample_user_data['username'],
-        salt=sample_user_data['salt'],
-        hashed_password=bcrypt.hashpw(
-            sample_user_data['password'].encode('utf-8'),
-            sample_user_data['salt']
-        )
+        hashed_password=sample_user_data['hashed']
     )
     assert user.id == sample_user_data['id']
     assert user.username == sample_user_data['username']
@@ -68,19 +64,11 @@ def test_create_user_duplicate_username(mock_db_connection, sample_user_data):
             password=sample_user_data['password']
         )
 
-def test_login_success(mock_db_connection, sample_user_data):
+def test_login_success(mocker, mock_db_connection, sample_user_data):
     """Test successful login"""
+    mock_record_login = mocker.patch("app.models.user._record_login")
     # Prepare mock response
-    salt = sample_user_data['salt']
-    hashed_pass = bcrypt.hashpw(
-        sample_user_data['password'].encode('utf-8'),
-        salt
-    )
-    mock_db_connection.fetchone.return_value = {
-        'id': sample_user_data['id'],
-        'salt': salt,
-        'password_hash': hashed_pass
-    }
+    mock_db_connection.fetchone.return_value = (sample_user_data['id'], sample_user_data['username'], sample_user_data['hashed'])
     
     user = User.login(
         username=sample_user_data['username'],
@@ -89,16 +77,41 @@ def test_login_success(mock_db_connection, sample_user_data):
     
     assert user.id == sample_user_data['id']
     assert user.username == sample_user_data['username']
+    mock_record_login.assert_called_once_with(sample_user_data['id'])
+
+def test_login_returns_stored_username(mocker, mock_db_connection, sample_user_data):
+    """Test that login uses the username as stored, not as typed"""
+    mocker.patch("app.models.user._record_login")
+    mock_db_connection.fetchone.return_value = (sample_user_data['id'], sample_user_data['username'], sample_user_data['hashed'])
+
+    user = User.login(username='TestUser', password=sample_user_data['password'])
+
+    assert user.username == sample_user_data['username']
+
+def test_flush_last_logins(mocker, monkeypatch):
+    """Test that queued logins are written in one transaction"""
+    mock_conn = mocker.Mock(spec=sqlite3.Connection)
+
+    monkeypatch.setattr("app.models.user.get_db_connection", MockConnectionContext(mock_conn))
+
+    _flush_last_logins([1, 2])
 
-def test_login_invalid_username(mock_db_connection, sample_user_data):
+    mock_conn.executemany.assert_called_once()
+    assert mock_conn.executemany.call_args[0][1] == [(1,), (2,)]
+    mock_conn.commit.assert_called_once()
+
+def test_login_invalid_username(mocker, mock_db_connection, sample_user_data):
     """Test login with invalid username"""
     mock_db_connection.fetchone.return_value = None
+    checkpw = mocker.spy(bcrypt, "checkpw")
     
     with pytest.raises(ValueError, match="Invalid username or password"):
         User.login(
             username=sample_user_data['username'],
             password=sample_user_data['password']
         )
+    # A missing user still pays for one password check
+    checkpw.assert_called_once()
 
 def test_login_invalid_password(mock_db_connection, sample_user_data):
     """Test login with invalid password"""
@@ -107,11 +120,7 @@ def test_login_invalid_password(mock_db_connection, sample_user_data):
         'different_password'.encode('utf-8'),
         salt
     )
-    mock_db_connection.fetchone.return_value = {
-        'id': sample_user_data['id'],
-        'salt': salt,
-        'password_hash': hashed_pass
-    }
+    mock_db_connection.fetchone.return_value = (sample_user_data['id'], sample_user_data['username'], hashed_pass)
     
     with pytest.raises(ValueError, match="Invalid username or password"):
         User.login(
@@ -124,11 +133,7 @@ def test_update_password_success(mock_db_connection, sample_user_data):
     user = User(
         id=sample_user_data['id'],
         username=sample_user_data['username'],
-        salt=sample_user_data['salt'],
-        hashed_password=bcrypt.hashpw(
-            sample_user_data['password'].encode('utf-8'),
-            sample_user_data['salt']
-        )
+        hashed_password=sample_user_data['hashed']
     )
 
     user.update_password(
@@ -143,11 +148,7 @@ def test_update_password_incorrect_current(mock_db_connection, sample_user_data)
     user = User(
         id=sample_user_data['id'],
         username=sample_user_data['username'],
-        salt=sample_user_data['salt'],
-        hashed_password=bcrypt.hashpw(
-            sample_user_data['password'].encode('utf-8'),
-            sample_user_data['salt']
-        )
+        hashed_password=sample_user_data['hashed']
     )
     
     with pytest.raises(ValueError, match="Current password is incorrect"):
@@ -156,26 +157,93 @@ def test_update_password_incorrect_current(mock_db_connection, sample_user_data)
             new_password='new_password123'
         )
 
+def test_update_password_stale_hash(mock_db_connection, sample_user_data):
+    """Test password update is refused when the stored hash changed since it was loaded"""
+    user = User(
+        id=sample_user_data['id'],
+        username=sample_user_data['username'],
+        hashed_password=sample_user_data['hashed']
+    )
+    mock_db_connection.rowcount = 0
+
+    with pytest.raises(ValueError, match="Current password is incorrect"):
+        user.update_password(
+            current_password=sample_user_data['password'],
+            new_password='new_password123'
+        )
+
+    params = mock_db_connection.execute.call_args.args[1]
+    assert params[1:] == (sample_user_data['id'], sample_user_data['hashed'])
+
 def test_get_by_id_success(mock_db_connection, sample_user_data):
     """Test successful user retrieval by ID"""
-    mock_db_connection.fetchone.return_value = {
-        'id': sample_user_data['id'],
-        'username': sample_user_data['username'],
-        'salt': sample_user_data['salt'],
-        'password_hash': bcrypt.hashpw(
-            sample_user_data['password'].encode('utf-8'),
-            sample_user_data['salt']
-        )
-    }
+    mock_db_connection.fetchone.return_value = (
+        sample_user_data['id'],
+        sample_user_data['username'],
+        sample_user_data['hashed']
+    )
     
     user = User.get_by_id(sample_user_data['id'])
     
     assert user.id == sample_user_data['id']
     assert user.username == sample_user_data['username']
 
+def test_get_by_id_cached(mock_db_connection, sample_user_data):
+    """Test that a repeat lookup of the same user skips the database"""
+    mock_db_connection.fetchone.return_value = (
+        sample_user_data['id'],
+        sample_user_data['username'],
+        b'hash'
+    )
+
+    first = User.get_by_id(sample_user_data['id'])
+    second = User.get_by_id(sample_user_data['id'])
+
+    assert second.username == first.username
+    mock_db_connection.execute.assert_called_once()
+
 def test_get_by_id_not_found(mock_db_connection):
     """Test user retrieval with non-existent ID"""
     mock_db_connection.fetchone.return_value = None
     
     result = User.get_by_id(999)
-    assert result is None
\ No newline at end of file
+    assert result is None
+
+def test_exists(mock_db_connection):
+    """Test user existence check"""
+    mock_db_connection.fetchone.return_value = (1,)
+    assert User.exists(1) is True
+
+    mock_db_connection.fetchone.return_value = None
+    assert User.exists(999) is False
+
+def test_get_transaction_history_passes_paging(mocker, sample_user_data):
+    """Test that paging and symbol filters reach the portfolio manager"""
+    manager = mocker.patch("app.models.user.get_portfolio_manager").return_value
+    user = User(sample_user_data['id'], sample_user_data['username'], sample_user_data['hashed'])
+
+    assert user.get_transaction_history(limit=10, offset=20, symbol='AAPL') is manager.get_transaction_history.return_value
+    manager.get_transaction_history.assert_called_once_with(1, 10, 20, 'AAPL')
+
+def test_last_login_writer_survives_errors(monkeypatch):
+    """Test that a failed flush doesn't stop later logins from being written"""
+    first_flush = threading.Event()
+    second_flush = threading.Event()
+    flushed = []
+
+    def flaky_flush(user_ids):
+        flushed.append(set(user_ids))
+        if not first_flush.is_set():
+            first_flush.set()
+            raise RuntimeError("boom")
+        second_flush.set()
+
+    monkeypatch.setattr("app.models.user.LAST_LOGIN_FLUSH_INTERVAL", 0)
+    monkeypatch.setattr("app.models.user._flush_last_logins", flaky_flush)
+
+    _record_login(1)
+    assert first_flush.wait(timeout=5)
+    _record_login(2)
+
+    assert second_flush.wait(timeout=5)
+    assert flushed[-1] == {2}
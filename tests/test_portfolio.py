@@ -1,44 +1,56 @@
+import sqlite3
+import threading
 import pytest
 from unittest.mock import Mock
-from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timezone
 from app.models.portfolio import PortfolioManager
 from app.models.stock import StockAPI
+from app.utils.sql_utils import execute_read, execute_write
+from tests.helpers import MockConnectionContext
+
+# Mock(spec=SomeClass) runs dir() on the class every time; the attribute
+# names never change, so list them once and reuse them for every mock
+_STOCK_API_SPEC = dir(StockAPI)
 
 @pytest.fixture
-def mock_db_connection(mocker):
-    mock_conn = Mock()
-    mock_cursor = Mock()
+def mock_db_connection(monkeypatch):
+    mock_conn = Mock(spec=sqlite3.Connection)
+    mock_cursor = Mock(spec=sqlite3.Cursor)
     mock_conn.cursor.return_value = mock_cursor
     mock_cursor.fetchone.return_value = None
     mock_cursor.fetchall.return_value = []
+    mock_cursor.rowcount = 1
     mock_conn.commit.return_value = None
 
-    @contextmanager
-    def mock_get_db_connection():
-        yield mock_conn
-
-    mocker.patch("app.models.portfolio.get_db_connection", mock_get_db_connection)
+    monkeypatch.setattr("app.models.portfolio.get_db_connection", MockConnectionContext(mock_conn))
 
     return mock_conn
 
 @pytest.fixture
-def mock_execute_query(mocker):
-    mock_exec_query = mocker.patch("app.models.portfolio.execute_query")
-    mock_exec_query.return_value = []
-    return mock_exec_query
+def mock_cursor(mock_db_connection):
+    return mock_db_connection.cursor.return_value
+
+@pytest.fixture
+def mock_execute_read(mocker):
+    mock_exec_read = mocker.patch("app.models.portfolio.execute_read")
+    mock_exec_read.return_value = []
+    return mock_exec_read
 
 @pytest.fixture
 def mock_stock_api(mocker):
-    mock_api = mocker.Mock(spec=StockAPI)
-    mocker.patch("app.models.portfolio.StockAPI", return_value=mock_api)
-    return mock_api
+    return mocker.Mock(spec=_STOCK_API_SPEC)
 
 @pytest.fixture
-def portfolio_manager(mock_stock_api):
-    return PortfolioManager()
+def fixed_now(mocker):
+    now = datetime(2024, 3, 6, 10, 0, 0, tzinfo=timezone.utc)
+    mocker.patch("app.models.portfolio.datetime", **{'now.return_value': now})
+    return now
 
 @pytest.fixture
+def portfolio_manager(mock_stock_api):
+    return PortfolioManager(stock_api=mock_stock_api)
+
+@pytest.fixture(scope="session")
 def sample_stock_data():
     return {
         'symbol': 'AAPL',
@@ -50,11 +62,11 @@ def sample_stock_data():
         'volume': 1000000
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_portfolio_data():
     return [
-        {'symbol': 'AAPL', 'quantity': 10, 'average_price': 100.0},
-        {'symbol': 'GOOGL', 'quantity': 5, 'average_price': 150.0}
+        {'symbol': 'AAPL', 'quantity': 10, 'average_price': 100.0, 'cost_basis': 1000.0},
+        {'symbol': 'GOOGL', 'quantity': 5, 'average_price': 150.0, 'cost_basis': 750.0}
     ]
 
 ######################################################
@@ -63,28 +75,48 @@ def sample_portfolio_data():
 #
 ######################################################
 
-def test_get_portfolio_empty(portfolio_manager, mock_execute_query):
-    mock_execute_query.return_value = []
+def test_get_portfolio_empty(portfolio_manager, mock_execute_read):
+    mock_execute_read.return_value = []
     portfolio = portfolio_manager.get_portfolio(1)
     assert portfolio['holdings'] == []
     assert portfolio['total_value'] == 0.0
-    mock_execute_query.assert_called()
+    mock_execute_read.assert_called()
 
-def test_get_portfolio_with_holdings(portfolio_manager, mock_execute_query, mock_stock_api, sample_portfolio_data, sample_stock_data):
-    mock_execute_query.return_value = sample_portfolio_data
-    mock_stock_api.get_stock_price.return_value = sample_stock_data
+def test_get_portfolio_with_holdings(portfolio_manager, mock_execute_read, mock_stock_api, sample_portfolio_data, sample_stock_data):
+    mock_execute_read.return_value = sample_portfolio_data
+    mock_stock_api.get_prices_bulk.return_value = {'AAPL': sample_stock_data, 'GOOGL': sample_stock_data}
     portfolio = portfolio_manager.get_portfolio(1)
+    mock_stock_api.get_prices_bulk.assert_called_once_with(['AAPL', 'GOOGL'])
     assert len(portfolio['holdings']) == 2
     assert portfolio['holdings'][0]['symbol'] == 'AAPL'
     assert portfolio['holdings'][0]['quantity'] == 10
     assert portfolio['total_value'] > 0
-    mock_execute_query.assert_called()
+    mock_execute_read.assert_called()
 
-def test_get_portfolio_api_failure(portfolio_manager, mock_execute_query, mock_stock_api, sample_portfolio_data):
+def test_get_portfolio_values(portfolio_manager, mock_execute_read, mock_stock_api, sample_portfolio_data, sample_stock_data):
+    mock_execute_read.return_value = sample_portfolio_data
+    mock_stock_api.get_prices_bulk.return_value = {'AAPL': sample_stock_data, 'GOOGL': sample_stock_data}
+    portfolio = portfolio_manager.get_portfolio(1)
+    assert portfolio['holdings'][0]['total_value'] == 1020.0
+    assert portfolio['holdings'][0]['gain_loss'] == 20.0
+    assert portfolio['holdings'][1]['gain_loss'] == -240.0
+    assert portfolio['total_value'] == 1530.0
+
+def test_get_portfolio_values_from_db(portfolio_manager, sqlite_db, mock_stock_api, sample_stock_data):
+    execute_write("INSERT INTO users (id, username, password_hash) VALUES (1, 'testuser', 'hashed')")
+    execute_write("INSERT INTO portfolio (user_id, symbol, quantity, average_price) VALUES (1, 'AAPL', 10, 100.0)")
+    execute_write("INSERT INTO portfolio (user_id, symbol, quantity, average_price) VALUES (1, 'GOOGL', 0, 150.0)")
+    mock_stock_api.get_prices_bulk.return_value = {'AAPL': sample_stock_data}
+    portfolio = portfolio_manager.get_portfolio(1)
+    assert [h['symbol'] for h in portfolio['holdings']] == ['AAPL']
+    assert portfolio['holdings'][0]['gain_loss'] == 20.0
+    assert portfolio['total_value'] == 1020.0
+
+def test_get_portfolio_api_failure(portfolio_manager, mock_execute_read, mock_stock_api, sample_portfolio_data):
     # Suppose one symbol fails
-    mock_execute_query.return_value = sample_portfolio_data
-    # Let get_stock_price raise an exception for the first symbol
-    mock_stock_api.get_stock_price.side_effect = Exception("API Failure")
+    mock_execute_read.return_value = sample_portfolio_data
+    # Let the batched price lookup raise an exception
+    mock_stock_api.get_prices_bulk.side_effect = Exception("API Failure")
     with pytest.raises(Exception, match="API Failure"):
         portfolio_manager.get_portfolio(1)
 
@@ -94,23 +126,37 @@ def test_get_portfolio_api_failure(portfolio_manager, mock_execute_query, mock_s
 #
 ######################################################
 
-def test_buy_stock_success(portfolio_manager, mock_execute_query, mock_db_connection, mock_stock_api, sample_stock_data):
+def test_buy_stock_success(portfolio_manager, mock_execute_read, mock_db_connection, mock_cursor, mock_stock_api, sample_stock_data, fixed_now):
     mock_stock_api.get_stock_price.return_value = sample_stock_data
-    mock_execute_query.return_value = []
+    mock_execute_read.return_value = []
     result = portfolio_manager.buy_stock(1, 'AAPL', 10)
     assert result['symbol'] == 'AAPL'
     assert result['quantity'] == 10
     assert result['price'] == 102.0
-    assert isinstance(result['timestamp'], datetime)
-    assert mock_db_connection.cursor().execute.called
+    assert result['timestamp'] == fixed_now
+    # The stored transaction carries the same timestamp that was returned
+    assert mock_cursor.execute.call_args.args[1][-1] == '2024-03-06 10:00:00'
+    assert mock_cursor.execute.called
     assert mock_db_connection.commit.called
 
-def test_buy_stock_invalid_quantity(portfolio_manager):
-    with pytest.raises(ValueError, match="Quantity must be positive"):
-        portfolio_manager.buy_stock(1, 'AAPL', 0)
+def test_buy_stock_single_transaction(portfolio_manager, mock_db_connection, mock_cursor, mock_stock_api, sample_stock_data):
+    mock_stock_api.get_stock_price.return_value = sample_stock_data
+    portfolio_manager.buy_stock(1, 'AAPL', 10)
+    # One upsert for the holding and one transaction row, committed together
+    assert mock_cursor.execute.call_count == 2
+    mock_db_connection.commit.assert_called_once()
 
+@pytest.mark.parametrize("operation,quantity", [
+    ('buy_stock', 0),
+    ('buy_stock', -5),
+    ('sell_stock', 0),
+    ('sell_stock', -10),
+])
+def test_trade_invalid_quantity(portfolio_manager, mock_stock_api, operation, quantity):
     with pytest.raises(ValueError, match="Quantity must be positive"):
-        portfolio_manager.buy_stock(1, 'AAPL', -5)
+        getattr(portfolio_manager, operation)(1, 'AAPL', quantity)
+    # Rejected before any price lookup
+    mock_stock_api.get_stock_price.assert_not_called()
 
 def test_buy_stock_nonexistent_symbol(portfolio_manager, mock_stock_api):
     # If symbol doesn't exist, let get_stock_price raise KeyError or return None
@@ -118,37 +164,61 @@ def test_buy_stock_nonexistent_symbol(portfolio_manager, mock_stock_api):
     with pytest.raises(KeyError, match="Symbol not found"):
         portfolio_manager.buy_stock(1, 'FAKE', 10)
 
-def test_sell_stock_success(portfolio_manager, mock_execute_query, mock_db_connection, mock_stock_api, sample_stock_data):
-    mock_execute_query.side_effect = [
-        [{'quantity': 10}],  # check shares
-        []  # subsequent queries
-    ]
+def test_sell_stock_success(portfolio_manager, mock_execute_read, mock_db_connection, mock_cursor, mock_stock_api, sample_stock_data, fixed_now):
+    mock_execute_read.return_value = [{'quantity': 10}]
     mock_stock_api.get_stock_price.return_value = sample_stock_data
     result = portfolio_manager.sell_stock(1, 'AAPL', 5)
     assert result['symbol'] == 'AAPL'
     assert result['quantity'] == 5
     assert result['price'] == 102.0
-    assert isinstance(result['timestamp'], datetime)
-    assert mock_db_connection.cursor().execute.called
+    assert result['timestamp'] == fixed_now
+    assert mock_cursor.execute.call_args.args[1][-1] == '2024-03-06 10:00:00'
+    assert mock_cursor.execute.called
     assert mock_db_connection.commit.called
 
-def test_sell_stock_insufficient_shares(portfolio_manager, mock_execute_query):
-    mock_execute_query.return_value = [{'quantity': 5}]
+def test_sell_stock_insufficient_shares(portfolio_manager, mock_execute_read, mock_stock_api):
+    mock_execute_read.return_value = [{'quantity': 5}]
     with pytest.raises(ValueError, match="Insufficient shares for sale"):
         portfolio_manager.sell_stock(1, 'AAPL', 10)
+    # Rejected by the advisory check before any price lookup
+    mock_stock_api.get_stock_price.assert_not_called()
 
-def test_sell_stock_nonexistent_symbol(portfolio_manager, mock_execute_query):
-    # If portfolio doesn't return the symbol at all
-    mock_execute_query.return_value = []
+def test_sell_stock_shares_sold_concurrently(portfolio_manager, mock_execute_read, mock_db_connection, mock_cursor, mock_stock_api, sample_stock_data):
+    # The advisory check passes, but another sale lands first so the
+    # conditional UPDATE matches no row
+    mock_execute_read.return_value = [{'quantity': 10}]
+    mock_stock_api.get_stock_price.return_value = sample_stock_data
+    mock_cursor.rowcount = 0
+    with pytest.raises(ValueError, match="Insufficient shares for sale"):
+        portfolio_manager.sell_stock(1, 'AAPL', 10)
+    assert mock_cursor.execute.call_count == 1
+    mock_db_connection.commit.assert_not_called()
+
+def test_sell_stock_nonexistent_symbol(portfolio_manager, mock_execute_read, mock_stock_api):
+    # If portfolio doesn't hold the symbol at all
+    mock_execute_read.return_value = []
     with pytest.raises(ValueError, match="Insufficient shares for sale"):
         portfolio_manager.sell_stock(1, 'FAKE', 1)
+    mock_stock_api.get_stock_price.assert_not_called()
 
-def test_sell_stock_invalid_quantity(portfolio_manager):
-    with pytest.raises(ValueError, match="Quantity must be positive"):
-        portfolio_manager.sell_stock(1, 'AAPL', 0)
+def test_sell_stock_queries_by_symbol(portfolio_manager, mock_execute_read, mock_cursor, mock_stock_api, sample_stock_data):
+    mock_execute_read.return_value = [{'quantity': 10}]
+    mock_stock_api.get_stock_price.return_value = sample_stock_data
+    portfolio_manager.sell_stock(1, 'AAPL', 5)
+    # The holding is found through the (user_id, symbol) unique index
+    sql, params = mock_cursor.execute.call_args_list[0].args
+    assert 'user_id = ? AND symbol = ?' in sql
+    assert params == (5, 1, 'AAPL', 5)
 
-    with pytest.raises(ValueError, match="Quantity must be positive"):
-        portfolio_manager.sell_stock(1, 'AAPL', -10)
+def test_sell_stock_checks_shares_in_update(portfolio_manager, sqlite_db, mock_stock_api, sample_stock_data):
+    mock_stock_api.get_stock_price.return_value = sample_stock_data
+    execute_write("INSERT INTO users (id, username, password_hash) VALUES (1, 'testuser', 'hashed')")
+    execute_write("INSERT INTO portfolio (user_id, symbol, quantity, average_price) VALUES (1, 'AAPL', 5, 100.0)")
+    with pytest.raises(ValueError, match="Insufficient shares for sale"):
+        portfolio_manager.sell_stock(1, 'AAPL', 10)
+    portfolio_manager.sell_stock(1, 'AAPL', 5)
+    assert execute_read("SELECT quantity FROM portfolio")[0]['quantity'] == 0
+    assert len(execute_read("SELECT id FROM transactions")) == 1
 
 ######################################################
 #
@@ -156,35 +226,67 @@ def test_sell_stock_invalid_quantity(portfolio_manager):
 #
 ######################################################
 
-def test_get_transaction_history_empty(portfolio_manager, mock_execute_query):
-    mock_execute_query.return_value = []
+def test_get_transaction_history_empty(portfolio_manager, mock_db_connection):
+    mock_db_connection.execute.return_value = []
     history = portfolio_manager.get_transaction_history(1)
     assert history == []
-    mock_execute_query.assert_called()
+    mock_db_connection.execute.assert_called()
 
-def test_get_transaction_history_non_empty(portfolio_manager, mock_execute_query):
+def test_get_transaction_history_non_empty(portfolio_manager, mock_db_connection):
     mock_transactions = [
         {
-            'id': 1,
+            'transaction_id': 1,
             'symbol': 'AAPL',
             'quantity': 10,
             'price': 100.0,
-            'transaction_type': 'BUY',
-            'timestamp': '2024-03-06 10:00:00'
+            'type': 'BUY',
+            'timestamp': '2024-03-06 10:00:00',
+            'total': 1000.0
         }
     ]
-    mock_execute_query.return_value = mock_transactions
+    mock_db_connection.execute.return_value = mock_transactions
     history = portfolio_manager.get_transaction_history(1)
     assert len(history) == 1
     assert history[0]['symbol'] == 'AAPL'
     assert history[0]['type'] == 'BUY'
-    mock_execute_query.assert_called()
+    assert history[0]['total'] == 1000.0
+    mock_db_connection.execute.assert_called()
+
+def test_get_transaction_history_respects_limit(portfolio_manager, mock_db_connection):
+    mock_db_connection.execute.return_value = []
+    portfolio_manager.get_transaction_history(1, limit=10, offset=20, symbol='AAPL')
+    params = mock_db_connection.execute.call_args.args[1]
+    assert params == (1, 'AAPL', 'AAPL', 10, 20)
+
+def test_get_transaction_history_pages(portfolio_manager, sqlite_db):
+    execute_write("INSERT INTO users (id, username, password_hash) VALUES (1, 'testuser', 'hashed')")
+    for day, symbol in enumerate(['AAPL', 'GOOGL', 'AAPL', 'AAPL'], start=1):
+        execute_write(
+            "INSERT INTO transactions (user_id, symbol, quantity, price, transaction_type, timestamp) "
+            "VALUES (1, ?, 1, 100.0, 'BUY', ?)",
+            (symbol, f'2024-03-0{day} 10:00:00')
+        )
+    page = portfolio_manager.get_transaction_history(1, limit=2, offset=1)
+    assert [row['timestamp'] for row in page] == ['2024-03-03 10:00:00', '2024-03-02 10:00:00']
+    aapl = portfolio_manager.get_transaction_history(1, symbol='AAPL')
+    assert [row['timestamp'][:10] for row in aapl] == ['2024-03-04', '2024-03-03', '2024-03-01']
+
+def test_get_transaction_history_same_second_newest_first(portfolio_manager, sqlite_db):
+    execute_write("INSERT INTO users (id, username, password_hash) VALUES (1, 'testuser', 'hashed')")
+    for _ in range(5):
+        execute_write(
+            "INSERT INTO transactions (user_id, symbol, quantity, price, transaction_type, timestamp) "
+            "VALUES (1, 'AAPL', 1, 100.0, 'BUY', '2024-03-06 10:00:00')"
+        )
+    first = portfolio_manager.get_transaction_history(1, limit=3)
+    second = portfolio_manager.get_transaction_history(1, limit=3, offset=3)
+    assert [row['transaction_id'] for row in first + second] == [5, 4, 3, 2, 1]
 
 def test_get_stock_info_full(portfolio_manager, mock_stock_api, sample_stock_data):
     mock_stock_api.get_stock_price.return_value = sample_stock_data
     mock_stock_api.get_company_info.return_value = {'name': 'Apple Inc'}
     mock_stock_api.get_historical_data.return_value = {'data': [sample_stock_data]}
-    info = portfolio_manager.get_stock_info('AAPL')
+    info = portfolio_manager.get_stock_info('AAPL', include_historical=True)
     assert 'current_price' in info
     assert 'company_info' in info
     assert 'historical_data' in info
@@ -196,18 +298,44 @@ def test_get_stock_info_missing_data(portfolio_manager, mock_stock_api):
     mock_stock_api.get_company_info.return_value = {}
     mock_stock_api.get_historical_data.side_effect = Exception("No historical data")
     with pytest.raises(Exception, match="No historical data"):
-        portfolio_manager.get_stock_info('AAPL')
+        portfolio_manager.get_stock_info('AAPL', include_historical=True)
+
+def test_get_stock_info_skips_historical_by_default(portfolio_manager, mock_stock_api, sample_stock_data):
+    mock_stock_api.get_stock_price.return_value = sample_stock_data
+    mock_stock_api.get_company_info.return_value = {'name': 'Apple Inc'}
+    info = portfolio_manager.get_stock_info('AAPL')
+    assert 'historical_data' not in info
+    assert info['current_price'] == sample_stock_data
+    mock_stock_api.get_historical_data.assert_not_called()
+
+def test_get_stock_info_concurrent(portfolio_manager, mock_stock_api, sample_stock_data):
+    # Each lookup waits until all three are running, so the barrier breaks
+    # (and the test fails) if they are made one after another
+    barrier = threading.Barrier(3, timeout=2)
+
+    def waits_for_others(result):
+        def lookup(symbol):
+            barrier.wait()
+            return result
+        return lookup
+
+    mock_stock_api.get_stock_price.side_effect = waits_for_others(sample_stock_data)
+    mock_stock_api.get_company_info.side_effect = waits_for_others({'name': 'Apple Inc'})
+    mock_stock_api.get_historical_data.side_effect = waits_for_others({'data': [sample_stock_data]})
+    info = portfolio_manager.get_stock_info('AAPL', include_historical=True)
+    assert set(info) == {'current_price', 'company_info', 'historical_data'}
+    assert info['company_info'] == {'name': 'Apple Inc'}
 
-def test_buy_stock_db_exception(portfolio_manager, mock_db_connection, mock_stock_api, sample_stock_data):
+def test_buy_stock_db_exception(portfolio_manager, mock_cursor, mock_stock_api, sample_stock_data):
     mock_stock_api.get_stock_price.return_value = sample_stock_data
     # Simulate DB failure during transaction
-    mock_db_connection.cursor().execute.side_effect = Exception("DB Failure")
+    mock_cursor.execute.side_effect = Exception("DB Failure")
     with pytest.raises(Exception, match="DB Failure"):
         portfolio_manager.buy_stock(1, 'AAPL', 10)
 
-def test_sell_stock_db_exception(portfolio_manager, mock_execute_query, mock_db_connection, mock_stock_api, sample_stock_data):
-    mock_execute_query.return_value = [{'quantity': 10}]
+def test_sell_stock_db_exception(portfolio_manager, mock_execute_read, mock_cursor, mock_stock_api, sample_stock_data):
+    mock_execute_read.return_value = [{'quantity': 10}]
     mock_stock_api.get_stock_price.return_value = sample_stock_data
-    mock_db_connection.cursor().execute.side_effect = Exception("DB Failure")
+    mock_cursor.execute.side_effect = [None, Exception("DB Failure")]
     with pytest.raises(Exception, match="DB Failure"):
         portfolio_manager.sell_stock(1, 'AAPL', 5)
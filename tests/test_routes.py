@@ -0,0 +1,64 @@
+import pytest
+from app import app
+from app.config import MAX_CONTENT_LENGTH
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+@pytest.fixture
+def mock_portfolio_manager(mocker):
+    """Patch the routes' PortfolioManager and treat every user ID as existing"""
+    mocker.patch("app.routes.portfolio.User.exists", return_value=True)
+    manager = mocker.Mock()
+    manager.buy_stock.return_value = {'symbol': 'AAPL'}
+    manager.sell_stock.return_value = {'symbol': 'AAPL'}
+    manager.get_transaction_history.return_value = []
+    mocker.patch("app.routes.portfolio.get_portfolio_manager", return_value=manager)
+    return manager
+
+######################################################
+#
+#    Request Validation Test Cases
+#
+######################################################
+
+@pytest.mark.parametrize("quantity", [2.7, -1, 0, "2.5", "abc", True, [3]])
+@pytest.mark.parametrize("route", ['/api/portfolio/buy', '/api/portfolio/sell'])
+def test_trade_rejects_invalid_quantity(client, mock_portfolio_manager, route, quantity):
+    response = client.post(route, json={'user_id': 1, 'symbol': 'AAPL', 'quantity': quantity})
+    assert response.status_code == 400
+    mock_portfolio_manager.buy_stock.assert_not_called()
+    mock_portfolio_manager.sell_stock.assert_not_called()
+
+@pytest.mark.parametrize("symbol", [123, ["A"], {"s": "A"}, "   "])
+@pytest.mark.parametrize("route", ['/api/portfolio/buy', '/api/portfolio/sell'])
+def test_trade_rejects_invalid_symbol(client, mock_portfolio_manager, route, symbol):
+    response = client.post(route, json={'user_id': 1, 'symbol': symbol, 'quantity': 1})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'symbol must be a non-empty string'}
+    mock_portfolio_manager.buy_stock.assert_not_called()
+    mock_portfolio_manager.sell_stock.assert_not_called()
+
+@pytest.mark.parametrize("quantity", [3, 3.0, "3"])
+def test_buy_accepts_whole_quantity(client, mock_portfolio_manager, quantity):
+    response = client.post('/api/portfolio/buy', json={'user_id': 1, 'symbol': ' AAPL ', 'quantity': quantity})
+    assert response.status_code == 200
+    mock_portfolio_manager.buy_stock.assert_called_once_with(1, 'AAPL', 3)
+
+def test_oversized_body_rejected(client, mock_portfolio_manager):
+    body = '{"padding": "' + 'x' * MAX_CONTENT_LENGTH + '"}'
+    response = client.post('/api/portfolio/buy', data=body, content_type='application/json')
+    assert response.status_code == 413
+    mock_portfolio_manager.buy_stock.assert_not_called()
+
+@pytest.mark.parametrize("query", ['limit=abc', 'offset=1.5', 'limit=0', 'limit=501', 'offset=-1'])
+def test_history_rejects_invalid_page(client, mock_portfolio_manager, query):
+    response = client.get(f'/api/portfolio/history/1?{query}')
+    assert response.status_code == 400
+    mock_portfolio_manager.get_transaction_history.assert_not_called()
+
+def test_history_passes_page(client, mock_portfolio_manager):
+    response = client.get('/api/portfolio/history/1?limit=10&offset=20&symbol=AAPL')
+    assert response.status_code == 200
+    mock_portfolio_manager.get_transaction_history.assert_called_once_with(1, 10, 20, 'AAPL')
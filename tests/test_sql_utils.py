@@ -0,0 +1,47 @@
+import pytest
+from app.utils.sql_utils import (
+    check_tables_exist,
+    execute_read,
+    execute_write,
+    get_db_connection,
+)
+
+def test_execute_write_then_read(sqlite_db):
+    """Test a committed write is visible to a later read"""
+    changed = execute_write(
+        "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+        ('testuser', 'hashed')
+    )
+
+    assert changed == 1
+    rows = execute_read("SELECT username FROM users WHERE username = ?", ('TESTUSER',))
+    assert [row['username'] for row in rows] == ['testuser']
+
+def test_connection_rolls_back_on_error(sqlite_db):
+    """Test an exception inside the block discards the open transaction"""
+    with pytest.raises(RuntimeError):
+        with get_db_connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                ('testuser', 'hashed')
+            )
+            raise RuntimeError("boom")
+
+    assert execute_read("SELECT id FROM users") == []
+
+def test_connection_is_reused(sqlite_db):
+    """Test a returned connection is handed out again instead of reopened"""
+    with get_db_connection() as first:
+        pass
+    with get_db_connection() as second:
+        assert second is first
+        assert second.execute("PRAGMA journal_mode").fetchone()[0] == 'memory'
+
+def test_check_tables_exist(sqlite_db):
+    """Test the schema check passes on a fresh database and fails without a table"""
+    check_tables_exist()
+
+    execute_write("DROP TABLE transactions")
+
+    with pytest.raises(Exception, match="Missing tables: transactions"):
+        check_tables_exist()
@@ -1,18 +1,50 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
 import pytest
 import requests
 
-from app.models.stock import StockAPI
+from app.models.stock import _CACHE, _ETAGS, _SESSION, PriceRefresher, RateLimitError, StockAPI
+from app.utils.sql_utils import execute_write
+
+# A one-day TIME_SERIES_DAILY response as Alpha Vantage returns it
+PRICE_RESPONSE = {
+    "Time Series (Daily)": {
+        "2024-12-10": {
+            "1. open": "185.23",
+            "2. high": "186.45",
+            "3. low": "184.89",
+            "4. close": "186.01",
+            "5. volume": "45678912"
+        }
+    }
+}
+
+def mock_api_response(mocker, payload):
+    """Patch the shared session so every request returns payload with a 200"""
+    mock_get = mocker.patch("app.models.stock._SESSION.get")
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {}
+    mock_get.return_value.content = orjson.dumps(payload)
+    return mock_get
+
+@pytest.fixture
+def mock_price_response(mocker):
+    """Fixture to answer every API request with PRICE_RESPONSE; returns the patched get."""
+    return mock_api_response(mocker, PRICE_RESPONSE)
 
 @pytest.fixture
 def stock_api():
-    """Fixture to provide a new instance of StockAPI for each test."""
+    """Fixture to provide a new instance of StockAPI for each test; conftest empties the cache."""
     return StockAPI()
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_symbol1():
     return "AAPL"
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_symbol2():
     return "GOOGL"
 
@@ -22,24 +54,8 @@ def sample_symbol2():
 #
 ######################################################
 
-def test_get_stock_price_success(mocker, stock_api, sample_symbol1):
+def test_get_stock_price_success(mock_price_response, stock_api, sample_symbol1):
     """Test successfully getting current stock price."""
-    mock_response = {
-        "Time Series (Daily)": {
-            "2024-12-10": {
-                "1. open": "185.23",
-                "2. high": "186.45",
-                "3. low": "184.89",
-                "4. close": "186.01",
-                "5. volume": "45678912"
-            }
-        }
-    }
-    
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = mock_response
-
     result = stock_api.get_stock_price(sample_symbol1)
     
     assert result["symbol"] == sample_symbol1
@@ -51,39 +67,39 @@ def test_get_stock_price_success(mocker, stock_api, sample_symbol1):
 
 def test_get_stock_price_invalid_symbol(mocker, stock_api):
     """Test error when requesting an invalid stock symbol."""
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = {"Error Message": "Invalid API call"}
+    mock_api_response(mocker, {"Error Message": "Invalid API call"})
     
     with pytest.raises(ValueError, match="Unable to get price for INVALID"):
         stock_api.get_stock_price("INVALID")
 
 def test_get_stock_price_api_error(mocker, stock_api, sample_symbol1):
     """Test handling of API request failure."""
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("app.models.stock._SESSION.get")
     mock_get.side_effect = requests.RequestException("API Error")
     
     with pytest.raises(requests.RequestException, match="API Error"):
         stock_api.get_stock_price(sample_symbol1)
 
-def test_get_stock_price_cache(mocker, stock_api, sample_symbol1):
-    """Test that caching works for stock price data."""
-    mock_response = {
-        "Time Series (Daily)": {
-            "2024-12-10": {
-                "1. open": "185.23",
-                "2. high": "186.45",
-                "3. low": "184.89",
-                "4. close": "186.01",
-                "5. volume": "45678912"
-            }
-        }
-    }
+def test_session_retries_are_bounded():
+    """Test that timeouts aren't retried repeatedly and Retry-After can't extend the wait."""
+    retries = _SESSION.get_adapter("https://www.alphavantage.co").max_retries
+    assert retries.read == 0
+    assert retries.connect == 1
+    assert retries.respect_retry_after_header is False
+
+def test_get_stock_price_quotes_symbol(mocker, stock_api):
+    """Test that the symbol is URL-encoded into the request."""
+    mock_get = mock_api_response(mocker, {"Error Message": "Invalid API call"})
     
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = mock_response
+    with pytest.raises(ValueError):
+        stock_api.get_stock_price("A&B")
+    
+    url = mock_get.call_args[0][0]
+    assert "function=TIME_SERIES_DAILY" in url
+    assert "symbol=A%26B&" in url
 
+def test_get_stock_price_cache(mock_price_response, stock_api, sample_symbol1):
+    """Test that caching works for stock price data."""
     # First call should hit the API
     result1 = stock_api.get_stock_price(sample_symbol1)
     
@@ -91,7 +107,73 @@ def test_get_stock_price_cache(mocker, stock_api, sample_symbol1):
     result2 = stock_api.get_stock_price(sample_symbol1)
     
     assert result1 == result2
-    mock_get.assert_called_once()  # API should only be called once
+    mock_price_response.assert_called_once()  # API should only be called once
+
+def test_get_stock_price_304_uses_cache(mocker, stock_api, sample_symbol1):
+    """Test that an expired price is revalidated with its ETag and reused on 304."""
+    first = mocker.Mock(status_code=200, headers={"ETag": '"v1"'}, content=orjson.dumps(PRICE_RESPONSE))
+    not_modified = mocker.Mock(status_code=304, headers={}, content=b"")
+    mock_get = mocker.patch("app.models.stock._SESSION.get", side_effect=[first, not_modified])
+    mock_time = mocker.patch("app.models.stock.time.monotonic", return_value=1000.0)
+
+    result1 = stock_api.get_stock_price(sample_symbol1)
+    mock_time.return_value = 1000.0 + 60 * 60  # past the price TTL
+    result2 = stock_api.get_stock_price(sample_symbol1)
+
+    assert result2 == result1
+    assert mock_get.call_count == 2
+    assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+def test_cache_eviction_drops_etag(mocker, stock_api):
+    """Test that evicting a cache entry also forgets its ETag."""
+    mocker.patch("app.models.stock.CACHE_MAXSIZE", 1)
+    response = mocker.Mock(status_code=200, headers={"ETag": '"v1"'}, content=orjson.dumps(PRICE_RESPONSE))
+    mocker.patch("app.models.stock._SESSION.get", return_value=response)
+
+    stock_api.get_stock_price("AAPL")
+    stock_api.get_stock_price("GOOGL")
+
+    assert ("price", "AAPL") not in _CACHE
+    assert ("price", "AAPL") not in _ETAGS
+    assert _ETAGS[("price", "GOOGL")] == '"v1"'
+
+def test_cache_shared_across_instances(mock_price_response, stock_api, sample_symbol1):
+    """Test that separate StockAPI instances share one response cache."""
+    result1 = stock_api.get_stock_price(sample_symbol1)
+    result2 = StockAPI().get_stock_price(sample_symbol1)
+    
+    assert result1 == result2
+    mock_price_response.assert_called_once()
+
+def test_get_stock_price_concurrent_misses_share_fetch(mocker, stock_api, sample_symbol1):
+    """Test that concurrent cache misses for one symbol make a single API call."""
+    release = threading.Event()
+
+    def slow_get(*args, **kwargs):
+        release.wait(timeout=5)
+        return mocker.Mock(status_code=200, content=orjson.dumps(PRICE_RESPONSE))
+
+    mock_get = mocker.patch("app.models.stock._SESSION.get", side_effect=slow_get)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(stock_api.get_stock_price, sample_symbol1) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert all(result == results[0] for result in results)
+    mock_get.assert_called_once()
+
+def test_get_prices_bulk(mock_price_response, stock_api, sample_symbol1, sample_symbol2):
+    """Test that bulk price lookup only requests symbols missing from the cache."""
+    # Warm the cache for the first symbol
+    stock_api.get_stock_price(sample_symbol1)
+    
+    result = stock_api.get_prices_bulk([sample_symbol1, sample_symbol2, sample_symbol1])
+    
+    assert set(result) == {sample_symbol1, sample_symbol2}
+    assert result[sample_symbol2]["close"] == 186.01
+    assert mock_price_response.call_count == 2  # One warm-up call, one for the cache miss
 
 ######################################################
 #
@@ -113,9 +195,7 @@ def test_get_company_info_success(mocker, stock_api, sample_symbol1):
         "52WeekLow": "124.17"
     }
     
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = mock_response
+    mock_api_response(mocker, mock_response)
 
     result = stock_api.get_company_info(sample_symbol1)
     
@@ -126,18 +206,50 @@ def test_get_company_info_success(mocker, stock_api, sample_symbol1):
     assert result["EPS"] == 5.89
     assert result["DividendYield"] == 0.65
 
+def test_get_company_info_handles_none(mocker, stock_api, sample_symbol1):
+    """Test that unavailable numeric fields come back as None."""
+    mock_response = {
+        "Symbol": "AAPL",
+        "Name": "Apple Inc",
+        "PERatio": "None",
+        "PEGRatio": "-",
+        "DividendYield": "",
+        "EPS": "5.89",
+        "Sector": "None"
+    }
+    
+    mock_api_response(mocker, mock_response)
+
+    result = stock_api.get_company_info(sample_symbol1)
+    
+    assert result["PERatio"] is None
+    assert result["PEGRatio"] is None
+    assert result["DividendYield"] is None
+    assert result["EPS"] == 5.89
+    # Text fields are passed through untouched
+    assert result["Sector"] == "None"
+
+def test_get_company_info_outlives_price_ttl(mocker, stock_api, sample_symbol1):
+    """Test that company info stays cached after price data would have expired."""
+    mock_get = mock_api_response(mocker, {"Symbol": "AAPL", "Name": "Apple Inc"})
+    mock_time = mocker.patch("app.models.stock.time.monotonic", return_value=1000.0)
+
+    stock_api.get_company_info(sample_symbol1)
+    mock_time.return_value = 1000.0 + 60 * 60  # an hour later
+    stock_api.get_company_info(sample_symbol1)
+
+    mock_get.assert_called_once()
+
 def test_get_company_info_invalid_symbol(mocker, stock_api):
     """Test error when requesting company info for an invalid symbol."""
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = {}
+    mock_api_response(mocker, {})
     
     with pytest.raises(ValueError, match="Unable to get company info for INVALID"):
         stock_api.get_company_info("INVALID")
 
 def test_get_company_info_api_error(mocker, stock_api, sample_symbol1):
     """Test handling of API request failure for company info."""
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("app.models.stock._SESSION.get")
     mock_get.side_effect = requests.RequestException("API Error")
     
     with pytest.raises(requests.RequestException, match="API Error"):
@@ -170,9 +282,7 @@ def test_get_historical_data_success(mocker, stock_api, sample_symbol1):
         }
     }
     
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = mock_response
+    mock_api_response(mocker, mock_response)
 
     result = stock_api.get_historical_data(sample_symbol1)
     
@@ -183,6 +293,43 @@ def test_get_historical_data_success(mocker, stock_api, sample_symbol1):
     assert result["data"][1]["date"] == "2024-12-09"
     assert result["data"][1]["close"] == 185.23
 
+def test_get_historical_data_compact_from_full(mocker, stock_api, sample_symbol1):
+    """Test that compact history is served from cached full history."""
+    mock_response = {
+        "Time Series (Daily)": {
+            f"2024-{month:02d}-{day:02d}": {
+                "1. open": "185.23",
+                "2. high": "186.45",
+                "3. low": "184.89",
+                "4. close": "186.01",
+                "5. volume": "45678912"
+            }
+            for month in range(12, 0, -1) for day in range(28, 0, -1)
+        }
+    }
+    
+    mock_get = mock_api_response(mocker, mock_response)
+
+    full = stock_api.get_historical_data(sample_symbol1, outputsize="full")
+    compact = stock_api.get_historical_data(sample_symbol1, outputsize="compact")
+    
+    assert len(full["data"]) == 336
+    assert compact["data"] == full["data"][:100]
+    mock_get.assert_called_once()
+
+def test_get_historical_data_compact_expires_with_full(mocker, stock_api, sample_symbol1):
+    """Test that compact history derived from full history isn't kept past its TTL."""
+    mock_get = mock_api_response(mocker, PRICE_RESPONSE)
+    mock_time = mocker.patch("app.models.stock.time.monotonic", return_value=1000.0)
+
+    stock_api.get_historical_data(sample_symbol1, outputsize="full")
+    stock_api.get_historical_data(sample_symbol1, outputsize="compact")
+    mock_time.return_value = 1000.0 + 24 * 60 * 60  # past the historical TTL
+    stock_api.get_historical_data(sample_symbol1, outputsize="compact")
+
+    assert mock_get.call_count == 2
+    assert "outputsize=compact" in mock_get.call_args.args[0]
+
 def test_get_historical_data_invalid_outputsize(stock_api, sample_symbol1):
     """Test error when providing invalid outputsize parameter."""
     with pytest.raises(ValueError, match="Unable to get historical data for AAPL"):
@@ -190,7 +337,7 @@ def test_get_historical_data_invalid_outputsize(stock_api, sample_symbol1):
 
 def test_get_historical_data_api_error(mocker, stock_api, sample_symbol1):
     """Test handling of API request failure for historical data."""
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("app.models.stock._SESSION.get")
     mock_get.side_effect = requests.RequestException("API Error")
     
     with pytest.raises(requests.RequestException, match="API Error"):
@@ -202,37 +349,92 @@ def test_get_historical_data_api_error(mocker, stock_api, sample_symbol1):
 #
 ######################################################
 
-def test_validate_symbol_success(mocker, stock_api, sample_symbol1):
+def test_validate_symbol_success(mock_price_response, stock_api, sample_symbol1):
     """Test successful validation of a valid stock symbol."""
-    mock_response = {
-        "Time Series (Daily)": {
-            "2024-12-10": {
-                "1. open": "185.23",
-                "2. high": "186.45",
-                "3. low": "184.89",
-                "4. close": "186.01",
-                "5. volume": "45678912"
-            }
-        }
-    }
-    
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = mock_response
-
     assert stock_api.validate_symbol(sample_symbol1) is True
 
 def test_validate_symbol_invalid(mocker, stock_api):
     """Test validation of an invalid stock symbol."""
-    mock_get = mocker.patch("requests.get")
-    mock_get.return_value.status_code = 200
-    mock_get.return_value.json.return_value = {"Error Message": "Invalid API call"}
+    mock_api_response(mocker, {"Error Message": "Invalid API call"})
+    
+    assert stock_api.validate_symbol("INVALID") is False
+
+def test_validate_symbol_invalid_cached(mocker, stock_api):
+    """Test that an invalid symbol is not looked up again right away."""
+    mock_get = mock_api_response(mocker, {"Error Message": "Invalid API call"})
+    
+    assert stock_api.validate_symbol("INVALID") is False
+    assert stock_api.validate_symbol("INVALID") is False
+    mock_get.assert_called_once()
+
+def test_validate_symbol_rate_limited_not_cached(mocker, stock_api, sample_symbol1):
+    """Test that a rate-limit notice doesn't mark a real symbol invalid."""
+    rate_limited = mocker.Mock(status_code=200, headers={}, content=orjson.dumps(
+        {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."}
+    ))
+    valid = mocker.Mock(status_code=200, headers={}, content=orjson.dumps(PRICE_RESPONSE))
+    mock_get = mocker.patch("app.models.stock._SESSION.get", side_effect=[rate_limited, valid])
+    
+    assert stock_api.validate_symbol(sample_symbol1) is False
+    assert stock_api.validate_symbol(sample_symbol1) is True
+    assert mock_get.call_count == 2
+
+def test_get_stock_price_rate_limited(mocker, stock_api, sample_symbol1):
+    """Test that a rate-limit notice is raised as a request failure, not an unknown symbol."""
+    mock_api_response(mocker, {"Information": "API rate limit reached"})
+    
+    with pytest.raises(RateLimitError):
+        stock_api.get_stock_price(sample_symbol1)
+
+def test_validate_symbol_invalid_rechecked_next_day(mocker, stock_api):
+    """Test that an invalid symbol stays cached for a day and is then looked up again."""
+    mock_get = mock_api_response(mocker, {"Error Message": "Invalid API call"})
+    mock_time = mocker.patch("app.models.stock.time.monotonic", return_value=1000.0)
     
     assert stock_api.validate_symbol("INVALID") is False
+    mock_time.return_value = 1000.0 + 60 * 60  # an hour later
+    assert stock_api.validate_symbol("INVALID") is False
+    mock_get.assert_called_once()
+
+    mock_time.return_value = 1000.0 + 25 * 60 * 60  # the next day
+    assert stock_api.validate_symbol("INVALID") is False
+    assert mock_get.call_count == 2
 
 def test_validate_symbol_api_error(mocker, stock_api, sample_symbol1):
     """Test symbol validation when API request fails."""
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("app.models.stock._SESSION.get")
     mock_get.side_effect = requests.RequestException("API Error")
     
-    assert stock_api.validate_symbol(sample_symbol1) is False
\ No newline at end of file
+    assert stock_api.validate_symbol(sample_symbol1) is False
+
+######################################################
+#
+#    Price Refresher Test Cases
+#
+######################################################
+
+def test_price_refresher_warms_cache(mock_price_response, stock_api, sqlite_db, sample_symbol1, sample_symbol2):
+    """Test that a refresh caches the price of every held symbol."""
+    execute_write("INSERT INTO users (id, username, password_hash) VALUES (1, 'testuser', 'hashed')")
+    for symbol, quantity in ((sample_symbol1, 10), (sample_symbol2, 0)):
+        execute_write(
+            "INSERT INTO portfolio (user_id, symbol, quantity, average_price) VALUES (1, ?, ?, 150.0)",
+            (symbol, quantity)
+        )
+
+    PriceRefresher(interval=30).refresh()
+    
+    # Only the symbol still held is fetched, and later lookups hit the cache
+    mock_price_response.assert_called_once()
+    assert stock_api.get_stock_price(sample_symbol1)["close"] == 186.01
+    mock_price_response.assert_called_once()
+
+def test_price_refresher_refreshes_at_startup(mocker):
+    """Test that the refresher warms the cache before its first wait."""
+    refresher = PriceRefresher(interval=3600)
+    mock_refresh = mocker.patch.object(refresher, "refresh")
+    refresher.stop()
+
+    refresher.run()
+
+    mock_refresh.assert_called_once()